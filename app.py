@@ -3,13 +3,35 @@ import google.generativeai as genai
 from pinecone import Pinecone
 import logging
 from prompts import *
-from openai import OpenAI
-from pdf_conversion import convert_to_pdf
+from openai import AsyncOpenAI
+from pdf_service import PdfRenderService
 import json
 from datetime import datetime
-from business_interviewer import BusinessInterviewer
+from business_interviewer import BusinessInterviewer, questionnaire
+from embedding_cache import EmbeddingCache, stats_delta
+from session import ConsultationScheduler, ConsultationSession, SchedulerFull, current_session, current_stage
+from stream_fanout import StreamFanout
+from log_writer import BufferedLogWriter
+from tracing import Trace, current_trace, registry, span
+from summarizer import IncrementalSummarizer
+from retrieval import RetrievalClient, RetrievalPrefetcher
+from local_index import LocalVectorIndex
+from hybrid_retrieval import BM25Index, HybridRetriever, extract_subqueries
+from prompt_assembly import PromptAssembler, content_role, content_text, estimate_tokens
+from run_state import RunStateStore
+from stage_cache import StageCache, stage_cache_key
+from pipeline import PipelineExecutor, StageResult, consultation_stages, dependents, format_timings, history_for
+from completeness import ContinuationMetrics, create_completeness_checker, finish_reason_name, is_final_finish_reason
+from provider_client import ProviderClient, ProviderError
+from model_routing import ModelRouter
 import sys
+import time
+import numpy as np
 import asyncio
+import atexit
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import websockets
 from aiohttp import web
 import aiohttp_cors
@@ -24,291 +46,869 @@ OPENAI_API_KEY = ""
 
 # Initialize clients
 genai.configure(api_key=GOOGLE_API_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-# Set up Pinecone index
+# Retries are handled by the provider clients below, not inside the SDK
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+# Bounded pool for provider SDKs that have no async client (Pinecone) and other blocking I/O
+PROVIDER_THREAD_POOL_SIZE = 16
+provider_executor = ThreadPoolExecutor(max_workers=PROVIDER_THREAD_POOL_SIZE, thread_name_prefix="provider")
+
+async def run_blocking(func, *args, **kwargs):
+    # Run a blocking call on the provider pool without stalling the event loop
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(provider_executor, functools.partial(context.run, func, *args, **kwargs))
+
+# Every provider call goes through a client with a per-attempt timeout (for Gemini:
+# until the first streamed chunk), an overall deadline, retries with exponential
+# backoff and jitter, a client-side rate limit (requests per second and burst) that
+# pauses on 429s, and a circuit breaker. Embedding and index reads are hedged: a
+# duplicate request goes out once the first is slower than the recent p95
+# (never sooner than hedge_after). Calls that still fail raise ProviderError.
+PROVIDER_SETTINGS = {
+    "gemini": {'timeout': 90.0, 'deadline': 300.0, 'rate': 5, 'burst': 10},
+    "openai": {'timeout': 20.0, 'deadline': 60.0, 'rate': 50, 'burst': 100, 'hedge_after': 2.0},
+    "pinecone": {'timeout': 10.0, 'deadline': 30.0, 'rate': 100, 'burst': 100, 'hedge_after': 1.0},
+}
+PROVIDER_MAX_ATTEMPTS = 4
+PROVIDER_BACKOFF_BASE = 0.5
+PROVIDER_BACKOFF_MAX = 16.0
+PROVIDER_BREAKER_FAILURES = 5
+PROVIDER_BREAKER_RESET = 30.0
+# Longest gap allowed between two streamed Gemini chunks
+GEMINI_STREAM_IDLE_TIMEOUT = 60.0
+providers = {
+    name: ProviderClient(
+        name, max_attempts=PROVIDER_MAX_ATTEMPTS, backoff_base=PROVIDER_BACKOFF_BASE, backoff_max=PROVIDER_BACKOFF_MAX,
+        failure_threshold=PROVIDER_BREAKER_FAILURES, reset_timeout=PROVIDER_BREAKER_RESET, **settings
+    )
+    for name, settings in PROVIDER_SETTINGS.items()
+}
+
+# Set up vector index: "pinecone" for the hosted index, "local" for a snapshot
+# exported with `python local_index.py export` (optionally with `build-ivf`)
+VECTOR_BACKEND = "pinecone"
 INDEX_NAME = "corpus-anything-llm-2"
 NAMESPACE = "pinecone"
-index = pc.Index(INDEX_NAME)
+LOCAL_INDEX_PATH = os.path.expanduser("~/.cache/ceo-pro/corpus-snapshot")
+LOCAL_INDEX_MODE = "exact"  # "exact" or "ivf"
+LOCAL_INDEX_NPROBE = 8
+
+if VECTOR_BACKEND == "local":
+    index = LocalVectorIndex(LOCAL_INDEX_PATH, mode=LOCAL_INDEX_MODE, nprobe=LOCAL_INDEX_NPROBE)
+else:
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    index = pc.Index(INDEX_NAME)
+
+# Set up embedding cache
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_COST_PER_1K_TOKENS = 0.00013
+EMBEDDING_CACHE_PATH = os.path.expanduser("~/.cache/ceo-pro/embeddings.sqlite3")
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_memory_entries=512, max_disk_bytes=512 * 1024 * 1024)
+EMBEDDING_BATCH_SIZE = 256
+
+# "combined" embeds prompt and summary as a single text (original behaviour). Each
+# query text includes the summary at the time of the retrieval, so only the first
+# retrieval is embedded up front and every later one makes its own request.
+# "split" embeds them separately and mixes the unit vectors, so the prompt side
+# of every retrieval is embedded up front in one batch request; batching the
+# retrievals only pays off in this mode.
+QUERY_EMBEDDING_MODE = "combined"
+SUMMARY_EMBEDDING_WEIGHT = 1.0
+
+# Model routing: every Gemini task (pipeline stages by name, the interviewer's
+# "interview_summary" and "process_query" steps, "summary" and "completeness") maps
+# to a tier and an output token limit. MODEL_TIERS runs from strongest to cheapest;
+# routes with 'downgrade' drop one tier while the scheduler's pressure (running plus
+# queued consultations over capacity) is at or above MODEL_DOWNGRADE_PRESSURE.
+# The final report and implementation plan always get the strongest model.
+MODEL_TIERS = {
+    "pro": "gemini-1.5-pro",
+    "flash": "gemini-1.5-flash",
+}
+STAGE_MAX_OUTPUT_TOKENS = 8192
+MODEL_ROUTES = {
+    "interview_summary": {'tier': "pro", 'max_output_tokens': 1024},
+    "process_query": {'tier': "pro", 'max_output_tokens': 2048, 'downgrade': True},
+    "PROMPT_1": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS, 'downgrade': True},
+    "PROMPT_2": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS, 'downgrade': True},
+    "PROMPT_3": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS, 'downgrade': True},
+    "PROMPT_4": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS, 'downgrade': True},
+    "PROMPT_5": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS, 'downgrade': True},
+    "CRITIQUE_PROMPT": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS, 'downgrade': True},
+    "CONTINUE_CRITIQUE_PROMPT": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS, 'downgrade': True},
+    "REWRITE_PROMPT": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS},
+    "IMPLEMENTATION_PROMPT": {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS},
+    # Uncapped: every retrieval embeds the summary and hybrid retrieval reads its closing keyword list
+    "summary": {'tier': "flash"},
+    "completeness": {'tier': "flash", 'max_output_tokens': 16},
+}
+DEFAULT_MODEL_ROUTE = {'tier': "pro", 'max_output_tokens': STAGE_MAX_OUTPUT_TOKENS}
+MODEL_DOWNGRADE_PRESSURE = 0.5
+model_router = ModelRouter(
+    MODEL_TIERS, MODEL_ROUTES, DEFAULT_MODEL_ROUTE,
+    pressure=lambda: scheduler.pressure,
+    downgrade_pressure=MODEL_DOWNGRADE_PRESSURE
+)
+
+# Stage output cache keyed on model, prompt template, user input and context.
+# STAGE_CACHE_SEMANTIC_THRESHOLD (cosine similarity of the consultation queries,
+# e.g. 0.97) also reuses outputs of near-identical consultations; None disables it.
+STAGE_CACHE_ENABLED = True
+STAGE_CACHE_PATH = os.path.expanduser("~/.cache/ceo-pro/stage_outputs.sqlite3")
+STAGE_CACHE_TTL = 7 * 86400
+STAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+STAGE_CACHE_SEMANTIC_THRESHOLD = None
+stage_cache = StageCache(STAGE_CACHE_PATH, STAGE_CACHE_TTL, STAGE_CACHE_MAX_BYTES) if STAGE_CACHE_ENABLED else None
+
+# Completeness checking for the continuation loop: "local", "local+llm" or "llm".
+# The local checker is only sure about truncation (MAX_TOKENS, unclosed code blocks
+# or tables, continuation markers); its other findings are hints that continue a
+# stage only when "local+llm" has the LLM confirm them.
+COMPLETENESS_CHECKER = "local"
+MAX_CONTINUATION_ROUNDS = 2
+completeness_route = model_router.route("completeness")
+completeness_checker = create_completeness_checker(
+    COMPLETENESS_CHECKER, completeness_route.model, providers["gemini"], completeness_route.max_output_tokens
+)
+
+# Set up retrieval
+RETRIEVAL_TOP_K = 12
+RETRIEVAL_SCORE_THRESHOLD = 0.0
+RETRIEVAL_CONTEXT_TOKEN_BUDGET = 8000
+INDEX_STATS_TTL = 300
+retrieval_client = RetrievalClient(
+    index, NAMESPACE, run_blocking,
+    top_k=RETRIEVAL_TOP_K,
+    score_threshold=RETRIEVAL_SCORE_THRESHOLD,
+    context_token_budget=RETRIEVAL_CONTEXT_TOKEN_BUDGET,
+    stats_ttl=INDEX_STATS_TTL,
+    provider=providers["pinecone"] if VECTOR_BACKEND == "pinecone" else None
+)
+
+# Retrieval for the next stage starts while the current stage generates.
+# "stale" uses the speculative result as is, "fresh" re-runs it if the summary
+# changed in the meantime, "off" disables prefetching.
+RETRIEVAL_PREFETCH_POLICY = "stale"
+
+# Hybrid retrieval fuses dense matches with a BM25 index over the chunk texts of a
+# local snapshot (LOCAL_INDEX_PATH, which shares ids with the vector index) across
+# the query plus sub-queries taken from the summary's keyword list
+HYBRID_RETRIEVAL = False
+HYBRID_MAX_SUBQUERIES = 4
+HYBRID_CANDIDATES_PER_QUERY = 24
+
+# Prompt assembly: per-stage token budgets for prompt + retrieved context, and a
+# budget for the chat history carried into each stage. CHAT_HISTORY_TOKEN_BUDGET=None
+# sizes the history to the routed model's context window (MODEL_CONTEXT_WINDOWS) less
+# the stage's prompt budget and output limit; a number caps it for every model.
+PROMPT_TOKEN_BUDGETS = {
+    "PROMPT_1": 16000,
+    "REWRITE_PROMPT": 10000,
+    "IMPLEMENTATION_PROMPT": 10000,
+}
+DEFAULT_PROMPT_TOKEN_BUDGET = 12000
+CHAT_HISTORY_TOKEN_BUDGET = None
+MODEL_CONTEXT_WINDOWS = {
+    "gemini-1.5-pro": 2097152,
+    "gemini-1.5-flash": 1048576,
+}
+PASSAGE_MAX_TOKENS = 600
+prompt_assembler = PromptAssembler(
+    PROMPT_TOKEN_BUDGETS,
+    default_budget=DEFAULT_PROMPT_TOKEN_BUDGET,
+    history_budget=CHAT_HISTORY_TOKEN_BUDGET,
+    passage_max_tokens=PASSAGE_MAX_TOKENS,
+    context_windows=MODEL_CONTEXT_WINDOWS
+)
 
 # Hardcoded query option (set to None if you want to use user input)
 HARDCODED_QUERY = None
 
-# Set up logging files
+# Set up logging files. Each consultation session writes its log, transcript and
+# reports into its own folder under downloads_folder; log_file only receives
+# server-level messages that happen outside a session.
 downloads_folder = os.path.expanduser("~/Downloads")
 log_file = os.path.join(downloads_folder, f"Business_Chatbot_Log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-transcript_file = os.path.join(downloads_folder, f"Conversation_Transcript_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-
-# Global variable to store the terminal output
-terminal_output = []
-websocket_connections = set()
+event_log_file = os.path.splitext(log_file)[0] + ".jsonl"
+
+# Log and transcript writes are queued to a background writer thread. Logs also
+# go to a JSON-lines file next to the text log when LOG_JSONL is set, and roll
+# over past LOG_MAX_BYTES; transcripts are never rotated.
+LOG_JSONL = True
+LOG_FLUSH_INTERVAL = 0.25
+LOG_MAX_BYTES = 20 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+log_writer = BufferedLogWriter(LOG_FLUSH_INTERVAL, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT)
+atexit.register(log_writer.close)
+
+# Set up consultation scheduler
+# Checkpoints of in-progress consultations, resumable by run ID
+RUN_STATE_PATH = os.path.expanduser("~/.cache/ceo-pro/runs")
+RUN_STATE_RETENTION_DAYS = 7
+run_state_store = RunStateStore(RUN_STATE_PATH)
+
+# Every run's spans are dumped to Trace_<run_id>.json in its artifact folder;
+# aggregated histograms are served from /metrics
+TRACE_DUMP_ENABLED = True
+
+# PDF export runs in a process pool; rendered PDFs are cached by source content hash
+PDF_RENDER_WORKERS = 3
+PDF_CACHE_PATH = os.path.expanduser("~/.cache/ceo-pro/pdf")
+pdf_service = PdfRenderService(PDF_CACHE_PATH, PDF_RENDER_WORKERS, run_blocking=run_blocking)
+
+MAX_CONCURRENT_CONSULTATIONS = 4
+MAX_QUEUED_CONSULTATIONS = 16
+scheduler = ConsultationScheduler(MAX_CONCURRENT_CONSULTATIONS, MAX_QUEUED_CONSULTATIONS)
+
+# Stage DAG: independent stages (the rewrite and the implementation plan, after
+# both critique rounds) run concurrently. MAX_CONCURRENT_STAGES caps generating
+# stages across all consultations in the process.
+PARALLEL_STAGES = True
+MAX_CONCURRENT_STAGES = 8
+stage_semaphore = None
+
+def stage_slots():
+    global stage_semaphore
+    if stage_semaphore is None:
+        stage_semaphore = asyncio.Semaphore(MAX_CONCURRENT_STAGES)
+    return stage_semaphore
+
+# Streamed chunks are coalesced per session and flushed every 16 ms or 4 KB
+STREAM_FLUSH_INTERVAL = 0.016
+STREAM_FLUSH_BYTES = 4096
+STREAM_MAX_PENDING_BATCHES = 256
+STREAM_SEND_TIMEOUT = 5.0
 
 async def capture_output(message):
-    global terminal_output
-    terminal_output.append(message)
     print(message)  # Still print to actual terminal for debugging
-    if websocket_connections:
-        await asyncio.gather(*[ws.send(json.dumps({'type': 'terminal', 'content': message})) for ws in websocket_connections])
+    session = current_session.get()
+    if session is not None:
+        session.terminal_output.append(message)
+        await session.send({'type': 'terminal', 'content': message})
 
 def log_to_file(message, category="INFO", print_to_console=True):
-    with open(log_file, 'a') as f:
-        f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] - {category}: {message}\n\n")
+    session = current_session.get()
+    now = datetime.now()
+    log_writer.write(session.log_file if session else log_file, f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] - {category}: {message}\n\n")
+    if LOG_JSONL:
+        log_writer.write_json(session.event_log_file if session else event_log_file, {
+            'time': now.isoformat(timespec='milliseconds'),
+            'session': session.session_id if session else None,
+            'stage': current_stage.get(),
+            'category': category,
+            'message': message,
+        })
     if print_to_console:
         logging.info(f"{category}: {message}")
 
-def log_transcript(role, message):
-    with open(transcript_file, 'a') as f:
-        f.write(f"{role}: {message}\n\n")
-
-def generate_embedding(text):
-    try:
-        response = openai_client.embeddings.create(
-            input=text,
-            model="text-embedding-3-large"
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        log_to_file(f"Error generating embedding: {str(e)}", "ERROR")
-        return None
-
-def check_index_empty():
-    try:
-        stats = index.describe_index_stats()
-        return stats['total_vector_count'] == 0
-    except Exception as e:
-        log_to_file(f"Error checking index stats: {str(e)}", "ERROR")
-        return None
+def clean_transcript_lines(text):
+    # Drops bracketed log-style lines; entries end in a newline, so filtering each
+    # entry on its own matches filtering the whole transcript
+    return '\n'.join(line for line in text.split('\n') if not line.startswith('['))
 
-def query_pinecone(prompt, summary=""):
+def log_transcript(role, message):
+    session = current_session.get()
+    entry = f"{role}: {message}\n\n"
+    log_writer.write(session.transcript_file, entry, rotate=False)
+    log_writer.write(session.cleaned_transcript_file, clean_transcript_lines(entry), rotate=False)
+
+async def generate_embeddings(texts):
+    vectors = await run_blocking(lambda: [embedding_cache.get(EMBEDDING_MODEL, text) for text in texts])
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    fetched = {}
+    for batch_start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+        batch = missing[batch_start:batch_start + EMBEDDING_BATCH_SIZE]
+        start = time.perf_counter()
+        with span("embedding.request", model=EMBEDDING_MODEL, texts=len(batch), retries=0) as request_span:
+            response = await providers["openai"].call(
+                lambda: openai_client.embeddings.create(input=batch, model=EMBEDDING_MODEL),
+                hedge=True
+            )
+            request_span.set(input_tokens=response.usage.total_tokens)
+        elapsed = time.perf_counter() - start
+        # The API only reports usage per request, so attribute it by text length
+        total_chars = sum(len(text) for text in batch) or 1
+        for item in response.data:
+            text = batch[item.index]
+            share = len(text) / total_chars
+            fetched[text] = await run_blocking(
+                embedding_cache.put, EMBEDDING_MODEL, text, item.embedding,
+                round(response.usage.total_tokens * share), elapsed * share
+            )
+    if missing:
+        log_to_file(f"Embedded {len(missing)} of {len(texts)} texts in {-(-len(missing) // EMBEDDING_BATCH_SIZE)} request(s)", print_to_console=False)
+    return np.vstack([vector if vector is not None else fetched[text] for text, vector in zip(texts, vectors)]).astype(np.float32, copy=False)
+
+async def generate_embedding(text):
+    return (await generate_embeddings([text]))[0]
+
+def combined_query_text(prompt, summary=""):
+    return f"{prompt}\n\nContext: {summary}".strip()
+
+def query_embedding_texts(prompt, summary=""):
+    # summary=None means the summary is not known yet, so only the prompt side can be embedded
+    if QUERY_EMBEDDING_MODE == "split":
+        return [prompt] + ([summary] if summary else [])
+    return [] if summary is None else [combined_query_text(prompt, summary)]
+
+async def prefetch_query_embeddings(queries):
+    texts = list(dict.fromkeys(text for prompt, summary in queries for text in query_embedding_texts(prompt, summary)))
+    if texts:
+        await generate_embeddings(texts)
+
+def unit_vector(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+async def build_query_embedding(prompt, summary=""):
+    embeddings = await generate_embeddings(query_embedding_texts(prompt, summary))
+    if len(embeddings) == 1:
+        return embeddings[0]
+    return unit_vector(unit_vector(embeddings[0]) + SUMMARY_EMBEDDING_WEIGHT * unit_vector(embeddings[1])).astype(np.float32)
+
+async def query_pinecone(prompt, summary=""):
     try:
-        combined_query = f"{prompt}\n\nContext: {summary}".strip()
-        log_to_file(f"Generating embedding for combined query: {combined_query[:100]}...")
-        embedding = generate_embedding(combined_query)
-        if embedding is None:
-            return "Error generating embedding for query"
+        log_to_file(f"Generating embedding for combined query: {combined_query_text(prompt, summary)[:100]}...")
+        embedding = await build_query_embedding(prompt, summary)
 
-        if check_index_empty():
+        if await retrieval_client.is_empty():
             log_to_file("Pinecone index is empty", "WARNING")
             return "Pinecone index is empty"
 
-        log_to_file("Querying Pinecone")
-        results = index.query(
-            namespace=NAMESPACE,
-            vector=embedding,
-            top_k=12,
-            include_values=True,
-            include_metadata=True
-        )
-        log_to_file("Pinecone query completed", print_to_console=False)
-
-        if not results['matches']:
+        with span("retrieval.query", mode="hybrid" if HYBRID_RETRIEVAL else "dense", backend=VECTOR_BACKEND) as query_span:
+            if HYBRID_RETRIEVAL:
+                subqueries = extract_subqueries(prompt, summary, HYBRID_MAX_SUBQUERIES)
+                log_to_file(f"Running hybrid retrieval with {len(subqueries)} sub-queries")
+                matches = await hybrid_retriever.search(summary or prompt, embedding, subqueries)
+            else:
+                log_to_file("Querying Pinecone")
+                matches = await retrieval_client.query(embedding)
+            query_span.set(matches=len(matches))
+        log_to_file(f"Pinecone query completed with {len(matches)} matches", print_to_console=False)
+
+        if not matches:
             log_to_file("No matches found in Pinecone query", "WARNING")
             return "No relevant information found in vector database"
 
-        relevant_info = ""
-        for match in results['matches']:
-            relevant_info += f"Score: {match['score']}, Text: {match['metadata'].get('text', 'No text available')}\n\n"
-        
-        return relevant_info
-    except Exception as e:
+        return retrieval_client.format_context(matches)
+    except ProviderError as e:
+        # Raised rather than passed on, so an error message never reaches a prompt as context
         log_to_file(f"Error querying Pinecone: {str(e)}", "ERROR")
-        return f"Error retrieving relevant information: {str(e)}"
-
-def initialize_chat_session():
-    model = genai.GenerativeModel('gemini-1.5-pro')
-    return model.start_chat(history=[])
+        raise
+
+hybrid_retriever = HybridRetriever(
+    lambda: BM25Index.from_snapshot(LOCAL_INDEX_PATH),
+    generate_embeddings,
+    retrieval_client.query,
+    run_blocking,
+    top_k=RETRIEVAL_TOP_K,
+    candidates_per_query=HYBRID_CANDIDATES_PER_QUERY,
+    max_subqueries=HYBRID_MAX_SUBQUERIES
+)
+
+def log_embedding_cache_stats(before):
+    delta = stats_delta(before, embedding_cache.stats())
+    saved_cost = delta['tokens_saved'] / 1000 * EMBEDDING_COST_PER_1K_TOKENS
+    log_to_file(
+        f"Embedding cache: {delta['memory_hits'] + delta['disk_hits']} hits "
+        f"({delta['memory_hits']} memory, {delta['disk_hits']} disk), {delta['misses']} misses, "
+        f"hit rate {delta['hit_rate']:.0%}, saved ~{delta['seconds_saved']:.2f}s and "
+        f"{delta['tokens_saved']} tokens (${saved_cost:.4f})",
+        "METRICS"
+    )
+
+def initialize_chat_session(route, history=None):
+    model = genai.GenerativeModel(route.model, generation_config=route.generation_config)
+    budget = prompt_assembler.history_budget_for(route.task, route.model, route.max_output_tokens)
+    history, _ = prompt_assembler.trim_history(history or [], budget)
+    return model.start_chat(history=history)
+
+async def next_chunk(chunks):
+    try:
+        return await asyncio.wait_for(chunks.__anext__(), GEMINI_STREAM_IDLE_TIMEOUT)
+    except StopAsyncIteration:
+        return None
+    except asyncio.TimeoutError:
+        raise ProviderError("gemini", f"stream stalled for {GEMINI_STREAM_IDLE_TIMEOUT:.0f}s")
+    except Exception as e:
+        # Chunks already streamed to the client cannot be retried; the stage fails and the run can be resumed
+        raise ProviderError("gemini", f"stream interrupted: {type(e).__name__}: {e}") from e
 
-async def send_message_to_gemini(chat, prompt):
+async def send_message_to_gemini(chat, prompt, model_name):
     try:
         await capture_output("Sending prompt to Gemini")
-        response = chat.send_message(prompt, stream=True)
-        full_response = ""
-        for chunk in response:
-            if chunk.text:
-                full_response += chunk.text
-                # Send each chunk as a separate message
-                for websocket in websocket_connections:
-                    await websocket.send(json.dumps({'type': 'stream', 'content': chunk.text}))
-                await asyncio.sleep(0.05)  # Increased delay for smoother updates
+        with span("gemini.generate", model=model_name, stage=current_stage.get(), retries=0) as generate_span:
+            # Opening the stream (which waits for the first chunk) is retried; the chat
+            # history only changes once a request succeeds
+            response = await providers["gemini"].call(lambda: chat.send_message_async(prompt, stream=True))
+            chunks = response.__aiter__()
+            full_response = ""
+            finish_reason = None
+            usage = None
+            while True:
+                chunk = await next_chunk(chunks)
+                if chunk is None:
+                    break
+                if getattr(chunk, 'usage_metadata', None):
+                    usage = chunk.usage_metadata
+                if chunk.candidates and chunk.candidates[0].finish_reason:
+                    finish_reason = finish_reason_name(chunk.candidates[0].finish_reason)
+                if chunk.parts and chunk.text:
+                    generate_span.chunk(chunk.text)
+                    full_response += chunk.text
+                    current_session.get().stream_text(chunk.text, current_stage.get())
+            generate_span.set(finish_reason=finish_reason)
+            if usage is not None:
+                generate_span.set(input_tokens=usage.prompt_token_count, output_tokens=usage.candidates_token_count)
         await capture_output("Received response from Gemini")
-        return full_response
-    except Exception as e:
+        if usage is not None:
+            log_to_file(f"Gemini reported {usage.prompt_token_count} input / {usage.candidates_token_count} output tokens", "METRICS", print_to_console=False)
+        return full_response, finish_reason
+    except ProviderError as e:
         await capture_output(f"Error in send_message_to_gemini: {str(e)}")
-        return "Error generating response from Gemini"
-
-def summarize_conversation(conversation_history):
-    prompt = f"""
-Write a detailed, comprehensive summary of the following business consultation conversation, focusing on the highly specific key concepts regarding the business problem, highly specific business information/metrics, and highly specific questions based on the problem. Do not mention the logic technique strategies like Q* or Monte Carlo as they are irrelevant.  Give more weight to the most recent exchanges. Capture the evolving context of the discussion while highlighting the specific complex business issues. At the end, provide a long list of relevant questions, keywords, and phrases optimized for vector search in my corpus of business textbooks.
-
-Conversation transcript:
-{conversation_history}
+        raise
 
-Summary:
-"""
+async def refresh_summary(summarizer):
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        
-        if response.parts:
-            summary = response.text
-        else:
-            summary = "Error: Empty response from Gemini API"
-
-        log_to_file(f"Generated conversation summary: {summary}", print_to_console=False)
+        with span("summary.refresh", model=summarizer.model_name) as summary_span:
+            calls_before = summarizer.calls
+            summary = await summarizer.refresh()
+            result = summarizer.last_result
+            if result is not None and summarizer.calls > calls_before:
+                summary_span.set(cached=result.cached, input_tokens=result.input_tokens, output_tokens=result.output_tokens)
+        if result is not None:
+            log_to_file(
+                f"Updated running summary ({'memoized' if result.cached else f'{result.input_tokens} input / {result.output_tokens} output tokens'}; "
+                f"run total {summarizer.input_tokens} input / {summarizer.output_tokens} output tokens over {summarizer.calls} calls): {summary}",
+                print_to_console=False
+            )
         return summary
     except Exception as e:
-        error_msg = f"Error in summarize_conversation: {str(e)}"
-        log_to_file(error_msg, "ERROR")
-        return error_msg
+        # Keep the previous summary; the unsummarized exchange is folded in on the next refresh
+        log_to_file(f"Error in refresh_summary: {str(e)}", "ERROR")
+        return summarizer.summary
+
+async def export_pdf(session, file_path):
+    with span("pdf.export", file=os.path.basename(file_path)):
+        pdf_path = await pdf_service.render(file_path)
+    log_to_file(f"PDF generated at: {pdf_path}")
+    await session.send({'type': 'pdf_ready', 'file': os.path.basename(pdf_path)})
+    return pdf_path
+
+def create_interviewer():
+    return BusinessInterviewer(model_router, providers["gemini"])
 
 def save_final_report(report, filename):
-    file_path = os.path.join(downloads_folder, filename)
+    file_path = current_session.get().artifact_path(filename)
     with open(file_path, 'w') as f:
         f.write(report)
     log_to_file(f"Saved report to {file_path}")
 
-async def process_gemini_prompt(chat, prompt, continuation_prompt, vector_info):
-    formatted_prompt = f"""
-{prompt}
-Please utilize the following lessons and concepts from our business textbook database to assist in your answer:
-<database>
-{vector_info}
-</database>
-"""
+async def process_gemini_prompt(chat, prompt, continuation_prompt, vector_info, stage_name=None, metrics=None, route=None):
+    stage_name = stage_name or prompt.split()[0]
+    route = route or model_router.route(stage_name)
+    formatted_prompt = prompt_assembler.assemble(stage_name, prompt, vector_info)
+    history_tokens = sum(estimate_tokens(content_text(content)) for content in chat.history)
+    prompt_tokens = estimate_tokens(formatted_prompt)
+    log_to_file(
+        f"{stage_name} input: ~{prompt_tokens + history_tokens} tokens (~{prompt_tokens} prompt of "
+        f"{prompt_assembler.budget_for(stage_name)} budget, ~{history_tokens} history across {len(chat.history)} turns)",
+        "METRICS", print_to_console=False
+    )
     log_to_file(f"Formatted prompt sent to Gemini: {formatted_prompt}", "PROMPT", print_to_console=False)
     
-    response = await send_message_to_gemini(chat, formatted_prompt)
-    full_response = response
+    # The turns are rebuilt from what was sent and received: reading chat.history raises
+    # after a stream that Gemini stopped for safety or recitation
+    full_response, finish_reason = await send_message_to_gemini(chat, formatted_prompt, route.model)
+    turns = [{'role': 'user', 'parts': [formatted_prompt]}, {'role': 'model', 'parts': [full_response]}]
+    rounds = 0
     
     while True:
-        claude_check = summarize_conversation(full_response)
-        log_to_file(f"Claude completeness check: {claude_check}", print_to_console=False)
-        
-        if isinstance(claude_check, str):
-            if "NOT DONE" not in claude_check.upper():
-                break
-        else:
-            log_to_file(f"Unexpected type for claude_check: {type(claude_check)}", "WARNING")
+        try:
+            with span("completeness.check", checker=completeness_checker.name, stage=stage_name):
+                check = await completeness_checker.check(prompt, full_response, finish_reason)
+        except Exception as e:
+            log_to_file(f"Error in completeness check: {str(e)}", "ERROR")
+            stop_reason = "check error"
+            break
+        log_to_file(f"Completeness check ({completeness_checker.name}) after {rounds} continuation(s): {check}", print_to_console=False)
+        if check.complete:
+            stop_reason = check.reason
+            break
+        if not check.confident:
+            # A hint the checker could not settle (a short answer, or one that stops
+            # mid-sentence after STOP) is not worth another full generation
+            stop_reason = f"unconfirmed ({check.reason})"
+            break
+        if rounds >= MAX_CONTINUATION_ROUNDS:
+            stop_reason = f"max rounds ({check.reason})"
             break
         
-        continuation = await send_message_to_gemini(chat, continuation_prompt)
+        continuation, finish_reason = await send_message_to_gemini(chat, continuation_prompt, route.model)
         full_response += continuation
+        turns += [{'role': 'user', 'parts': [continuation_prompt]}, {'role': 'model', 'parts': [continuation]}]
+        rounds += 1
     
-    return full_response
-
-async def async_main_logic(user_input=None):
-    log_to_file("Starting CEO-PRO")
+    log_to_file(f"{stage_name} needed {rounds} continuation round(s); stopped on: {stop_reason}", "METRICS", print_to_console=False)
+    registry.increment('ceo_pro_continuation_rounds_total', {'stage': stage_name}, rounds)
+    if metrics is not None:
+        metrics.record(stage_name, rounds, stop_reason)
+    stopped = finish_reason if is_final_finish_reason(finish_reason) else None
+    if stopped:
+        # The stage is kept with whatever was generated so later stages still run
+        log_to_file(f"Gemini stopped {stage_name} for {stopped}; keeping the {len(full_response)} characters generated", "WARNING")
+        if not turns[-1]['parts'][0]:
+            # Gemini does not accept empty turns in a chat history
+            turns[-1]['parts'] = [f"[No response: generation was stopped for {stopped}]"]
+        full_response = full_response or turns[-1]['parts'][0]
+    return full_response, turns, stopped
+
+async def async_main_logic(user_input=None, run_id=None, bypass_cache=False):
+    session = current_session.get()
+    if session is None:
+        session = ConsultationSession(downloads_folder)
+        current_session.set(session)
+    log_to_file(f"Starting CEO-PRO session {session.session_id}")
     await capture_output("Welcome to CEO-PRO!")
     
-    conversation_history = ""
+    summary_route = model_router.route("summary")
+    summarizer = IncrementalSummarizer(summary_route.model, providers["gemini"], summary_route.max_output_tokens)
+    continuation_metrics = ContinuationMetrics()
     summary = ""
+    embedding_stats_before = embedding_cache.stats()
     
-    if user_input is None:
+    run_state = None
+    if run_id is not None:
+        run_state = run_state_store.load(run_id)
+        user_input = run_state.user_input
+    elif user_input is None:
         if HARDCODED_QUERY:
             user_input = HARDCODED_QUERY
             log_to_file(f"Using hardcoded query: {user_input}")
             await capture_output(f"Using hardcoded query: {user_input}")
         else:
-            interviewer = BusinessInterviewer(GOOGLE_API_KEY)
-            user_input = interviewer.conduct_interview()
+            interviewer = create_interviewer()
+            user_input = await interviewer.conduct_interview(functools.partial(run_blocking, input), capture_output)
             log_to_file(f"User input from interview: {user_input[:200]}...")  # Log first 200 characters
 
     full_response = ""
     while user_input.lower() != 'exit':
         log_transcript("User", user_input)
-        conversation_history += f"User: {user_input}\n\n"
-
-        vector_info = query_pinecone(user_input, summary)
-        log_to_file(f"Vector database information retrieved", print_to_console=False)
-
-        chat = initialize_chat_session()
+        stages = consultation_stages(user_input, PARALLEL_STAGES)
+        # The user input is embedded with the summary below; every other stage queries with a fixed prompt
+        retrieval_prompts = list(dict.fromkeys(stage.retrieval_prompt for stage in stages if stage.retrieval_prompt != user_input))
+        if run_state is None:
+            run_state = run_state_store.create(user_input)
+        # Resumes are claimed by websocket_handler before they are queued
+        run_state_store.claim(run_state.run_id)
+        restored = run_state.results()
+        trace = Trace(run_state.run_id)
+        current_trace.set(trace)
+        await session.send({'type': 'run', 'run_id': run_state.run_id})
+        await capture_output(f"Run ID: {run_state.run_id}")
+        if restored:
+            log_to_file(f"Resuming run {run_state.run_id}: {len(restored)} of {len(stages)} stages already complete")
+            summarizer.restore(run_state.summarizer)
+            summary = summarizer.summary
+            for stage in stages:
+                if stage.name in restored:
+                    log_transcript("Assistant", restored[stage.name].response)
+                    if stage.report_file:
+                        save_final_report(restored[stage.name].response, stage.report_file)
+        else:
+            summarizer.record("User", user_input)
+
+        query_vector = None
+        if stage_cache is not None and STAGE_CACHE_SEMANTIC_THRESHOLD is not None:
+            try:
+                query_vector = await generate_embedding(user_input)
+            except ProviderError as e:
+                log_to_file(f"Semantic stage cache lookup disabled for this run: {str(e)}", "WARNING")
+
+        # Embed every retrieval input that is already known in a single request (in
+        # "combined" mode that is only the first retrieval's query)
+        try:
+            await prefetch_query_embeddings([(user_input, summary)] + [(prompt, None) for prompt in retrieval_prompts])
+        except ProviderError as e:
+            # Only an optimization; each retrieval embeds what it needs itself
+            log_to_file(f"Error prefetching query embeddings: {str(e)}", "WARNING")
+
+        prefetcher = RetrievalPrefetcher(query_pinecone, RETRIEVAL_PREFETCH_POLICY)
+
+        def start_dependent_retrieval(stage, results):
+            # Overlap retrieval for the stages unblocked by this one with its generation
+            for dependent in dependents(stages, stage.name):
+                prefetcher.start(dependent.name, dependent.retrieval_prompt, summarizer.summary)
+
+        async def run_stage(stage, results):
+            started_at = time.perf_counter()
+            vector_info = await prefetcher.get(stage.name, stage.retrieval_prompt, summarizer.summary)
+            log_to_file(f"Vector database information retrieved for {stage.name}", print_to_console=False)
+            retrieved_at = time.perf_counter()
+
+            route = model_router.route(stage.name)
+            if route.downgraded:
+                log_to_file(f"Routing {stage.name} to {route.model} under load (scheduler pressure {scheduler.pressure:.2f})", "WARNING")
+            # Each stage continues a chat seeded with its ancestors' turns
+            chat = initialize_chat_session(route, history_for(stages, stage.name, results))
+            response, turns, cached_summary, stopped = None, None, None, None
+            if stage_cache is not None:
+                cache_context = json.dumps([
+                    prompt_assembler.assemble(stage.name, stage.prompt, vector_info),
+                    [(content_role(content), content_text(content)) for content in chat.history],
+                    route.max_output_tokens,
+                ])
+                cache_key = stage_cache_key(route.model, stage.template, user_input, cache_context)
+                if not bypass_cache:
+                    cached = await run_blocking(stage_cache.get, cache_key)
+                    if cached is None and query_vector is not None:
+                        cached = await run_blocking(
+                            stage_cache.find_similar, stage.name, route.model, stage.template, query_vector, STAGE_CACHE_SEMANTIC_THRESHOLD
+                        )
+                    if cached is not None:
+                        response, turns, cached_summary = cached['response'], cached['turns'], cached.get('summary')
+                        log_to_file(f"Stage cache hit for {stage.name}", print_to_console=False)
+            cache_hit = response is not None
+            try:
+                if not cache_hit:
+                    response, turns, stopped = await process_gemini_prompt(chat, stage.prompt, "continue with your response", vector_info, stage.name, continuation_metrics, route)
+                else:
+                    session.stream_text(response, stage.name)
+            finally:
+                session.end_stage_output(stage.name)
+            log_to_file(f"Gemini response for {stage.name} received", print_to_console=False)
+            generated_at = time.perf_counter()
 
-        for prompt_num, prompt in enumerate([PROMPT_1, PROMPT_2, PROMPT_3, PROMPT_4, PROMPT_5], start=1):
-            gemini_prompt = prompt.format(user_query=user_input) if prompt_num == 1 else prompt
-            response = await process_gemini_prompt(chat, gemini_prompt, "continue with your response", vector_info)
-            log_to_file(f"Gemini response for PROMPT_{prompt_num} received", print_to_console=False)
             log_transcript("Assistant", response)
-            conversation_history += f"Assistant: {response}\n\n"
-            summary = summarize_conversation(conversation_history)
-            vector_info = query_pinecone(prompt, summary)
-            full_response += response
-
-        for critique_prompt in [CRITIQUE_PROMPT, CONTINUE_CRITIQUE_PROMPT]:
-            vector_info = query_pinecone(critique_prompt, summary)
-            critique_response = await process_gemini_prompt(chat, critique_prompt, "continue with your response", vector_info)
-            log_to_file(f"Gemini response for {critique_prompt.split()[0]} received", print_to_console=False)
-            log_transcript("Assistant", critique_response)
-            conversation_history += f"Assistant: {critique_response}\n\n"
-            summary = summarize_conversation(conversation_history)
-            full_response += critique_response
-
-        final_report = await process_gemini_prompt(chat, REWRITE_PROMPT, "continue with your response", query_pinecone(REWRITE_PROMPT, summary))
-        log_to_file(f"Gemini response for REWRITE_PROMPT received", print_to_console=False)
-        log_transcript("Assistant", final_report)
-        conversation_history += f"Assistant: {final_report}\n\n"
-        save_final_report(final_report, "Final_Business_Report.md")
-        full_response += final_report
-
-        implementation_plan = await process_gemini_prompt(chat, IMPLEMENTATION_PROMPT, "continue with your response", query_pinecone(IMPLEMENTATION_PROMPT, summary))
-        log_to_file(f"Gemini response for IMPLEMENTATION_PROMPT received", print_to_console=False)
-        log_transcript("Assistant", implementation_plan)
-        conversation_history += f"Assistant: {implementation_plan}\n\n"
-        save_final_report(implementation_plan, "Final_Implementation_Plan.md")
-        full_response += implementation_plan
-
-        await capture_output("Assistant: Analysis complete. Final reports have been saved to your Downloads folder.")
+            summarizer.record("Assistant", response)
+            if not stage.updates_summary:
+                stage_summary = summarizer.summary
+            elif cache_hit and cached_summary is not None:
+                # Reusing the summary keeps later retrievals, and so later cache keys, identical
+                # to the run that was cached; regenerating it would not be deterministic
+                stage_summary = await summarizer.adopt(cached_summary)
+            else:
+                stage_summary = await refresh_summary(summarizer)
+            # A stopped stage is not cached, so the next consultation tries it again
+            if stage_cache is not None and not cache_hit and not stopped:
+                await run_blocking(
+                    stage_cache.put, cache_key, stage.name, route.model, stage.template,
+                    # A summary left behind by a failed refresh is not stored
+                    {'response': response, 'turns': turns,
+                     'summary': stage_summary if stage.updates_summary and not summarizer.has_pending else None},
+                    query_vector, time.perf_counter() - retrieved_at
+                )
+            if stage.report_file:
+                save_final_report(response, stage.report_file)
+
+            result = StageResult(stage.name, response, turns, vector_info, stage_summary)
+            result.timings.update(
+                retrieval=retrieved_at - started_at,
+                generation=generated_at - retrieved_at,
+                summary=time.perf_counter() - generated_at,
+            )
+            run_state.save_stage(result, summarizer.snapshot())
+            return result
+
+        executor = PipelineExecutor(run_stage, stage_slots(), start_dependent_retrieval)
+        pipeline_started = time.perf_counter()
+        try:
+            results = await executor.run(stages, restored)
+        except asyncio.CancelledError:
+            run_state.mark("interrupted")
+            raise
+        except Exception:
+            run_state.mark("failed")
+            raise
+        finally:
+            prefetcher.cancel_all()
+            run_state_store.release(run_state.run_id)
+        run_state.mark("complete")
+        run_state = None
+        summary = summarizer.summary
+        full_response += ''.join(results[stage.name].response for stage in stages)
+        log_to_file(
+            f"Stage timings ({'parallel' if PARALLEL_STAGES else 'sequential'}, wall clock {time.perf_counter() - pipeline_started:.2f}s, "
+            f"sum of stages {sum(results[name].timings['total'] for name in results if name not in restored):.2f}s, "
+            f"{len(restored)} restored from checkpoint):\n"
+            f"{format_timings(stages, results, pipeline_started)}",
+            "METRICS"
+        )
+
+        await capture_output(f"Assistant: Analysis complete. Final reports have been saved to {session.artifact_dir}.")
         log_to_file("Analysis complete. Final reports saved.")
 
-        convert_to_pdf(os.path.join(downloads_folder, "Final_Business_Report.md"))
-        convert_to_pdf(os.path.join(downloads_folder, "Final_Implementation_Plan.md"))
-        
-        with open(transcript_file, 'r') as f:
-            transcript_content = f.read()
-        
-        cleaned_transcript = '\n'.join([line for line in transcript_content.split('\n') if not line.startswith('[')])
-        
-        cleaned_transcript_file = os.path.join(downloads_folder, "Cleaned_Conversation_Transcript.md")
-        with open(cleaned_transcript_file, 'w') as f:
-            f.write(cleaned_transcript)
-        
-        convert_to_pdf(cleaned_transcript_file)
+        # The cleaned transcript is appended as stages finish; it only needs flushing
+        await run_blocking(log_writer.flush)
+        exports = await asyncio.gather(*[
+            export_pdf(session, path) for path in (
+                session.artifact_path("Final_Business_Report.md"),
+                session.artifact_path("Final_Implementation_Plan.md"),
+                session.cleaned_transcript_file,
+            )
+        ], return_exceptions=True)
+        for error in exports:
+            if isinstance(error, Exception):
+                log_to_file(f"Error in PDF export: {str(error)}", "ERROR")
         
         await capture_output("PDFs have been generated for the final reports and conversation transcript.")
         log_to_file("PDFs generated for final reports and conversation transcript.")
-
-        if HARDCODED_QUERY:
+        log_embedding_cache_stats(embedding_stats_before)
+        log_to_file(f"Summarization: {summarizer.stats()}", "METRICS")
+        log_to_file(f"Continuation rounds: {continuation_metrics.summary()}", "METRICS")
+        log_to_file(f"Retrieval prefetch: {prefetcher.stats()}", "METRICS")
+        if stage_cache is not None:
+            log_to_file(f"Stage cache (process totals): {stage_cache.stats()}", "METRICS")
+        log_to_file(f"PDF export (process totals): {pdf_service.stats()}", "METRICS")
+        log_to_file(f"Model routing (process totals): {model_router.stats()}", "METRICS")
+        log_to_file(f"Providers (process totals): { {name: provider.stats() for name, provider in providers.items()} }", "METRICS")
+        log_to_file(f"Trace totals: {trace.totals()}", "METRICS")
+        if TRACE_DUMP_ENABLED:
+            await run_blocking(trace.dump, session.artifact_path(f"Trace_{trace.run_id}.json"))
+        current_trace.set(None)
+        log_to_file(f"Log writer (process totals): {log_writer.stats()}", "METRICS")
+        embedding_stats_before = embedding_cache.stats()
+
+        # Only a terminal session can be asked for a follow-up; streamed sessions
+        # (websocket clients) start a new consultation per message
+        if HARDCODED_QUERY or session.stream is not None:
             break
         else:
-            user_input = input("User: ")
+            user_input = await run_blocking(input, "User: ")
             log_to_file(f"User input: {user_input}")
 
     log_to_file("CEO-Pro session ended")
     await capture_output("Thank you for using CEO-Pro!")
     return full_response
 
+async def wait_for_consultation(session, job, run_id=None):
+    try:
+        await job
+        await session.send({'type': 'complete'})
+    except asyncio.CancelledError:
+        log_to_file(f"Consultation for session {session.session_id} cancelled", "WARNING")
+        await session.send({'type': 'cancelled'})
+    except Exception as e:
+        log_to_file(f"Consultation for session {session.session_id} failed: {str(e)}", "ERROR")
+        await session.send({'type': 'error', 'content': str(e)})
+    finally:
+        # Also covers resumes that were cancelled before they started
+        if run_id is not None:
+            run_state_store.release(run_id)
+
 async def websocket_handler(websocket, path):
+    stream = StreamFanout(STREAM_FLUSH_INTERVAL, STREAM_FLUSH_BYTES, STREAM_MAX_PENDING_BATCHES, STREAM_SEND_TIMEOUT)
+    session = ConsultationSession(downloads_folder, websocket, stream=stream)
+    waiters = set()
+    interview_step = None
+
+    async def start_consultation(content, run_id=None, bypass_cache=False):
+        try:
+            job = scheduler.submit(session, functools.partial(async_main_logic, content, run_id, bypass_cache))
+        except SchedulerFull as e:
+            if run_id is not None:
+                run_state_store.release(run_id)
+            await session.send({'type': 'busy', 'content': f"Server is at capacity, please retry shortly ({str(e)})"})
+            return
+        await session.send({'type': 'queued', 'position': scheduler.queue_depth})
+        waiter = asyncio.create_task(wait_for_consultation(session, job, run_id))
+        waiters.add(waiter)
+        waiter.add_done_callback(waiters.discard)
+
+    async def advance_interview(data):
+        # Runs outside the message loop, since steps that call Gemini take a while
+        current_session.set(session)
+        try:
+            if data['type'] == 'interview':
+                step = session.interviewer.start()
+            elif data['type'] == 'intake':
+                step = await session.interviewer.submit(data)
+            else:
+                step = await session.interviewer.answer(str(data.get('content', "")))
+        except (ValueError, ProviderError) as e:
+            log_to_file(f"Interview step failed: {str(e)}", "ERROR")
+            # The interview stays where it was, so the client can send the answer again
+            await session.send({'type': 'error', 'content': str(e), 'interview': session.interviewer is not None})
+            return
+        await session.send({'type': 'interview', **step.to_dict()})
+        if step.state == "done":
+            session.interviewer = None
+            log_to_file(f"User input from interview: {step.result[:200]}...")
+            await start_consultation(step.result, bypass_cache=bool(data.get('bypass_cache')))
+
     try:
-        websocket_connections.add(websocket)
         async for message in websocket:
             data = json.loads(message)
-            if data['type'] == 'message':
-                await async_main_logic(data['content'])
-                await websocket.send(json.dumps({'type': 'complete'}))
+            if data['type'] in ('message', 'resume', 'interview', 'interview_answer', 'intake'):
+                if session.busy:
+                    await session.send({'type': 'busy', 'content': "A consultation is already running for this session"})
+                    continue
+                if interview_step is not None and not interview_step.done():
+                    await session.send({'type': 'busy', 'content': "The previous interview answer is still being processed"})
+                    continue
+            if data['type'] in ('message', 'resume'):
+                run_id = data.get('run_id')
+                content = data.get('content')
+                if run_id is None and not (isinstance(content, str) and content.strip()):
+                    # Without a query async_main_logic would fall back to the terminal interview
+                    await session.send({'type': 'error', 'content': "A message needs non-empty 'content' or a 'run_id' to resume"})
+                    continue
+                if run_id is not None and not run_state_store.exists(run_id):
+                    await session.send({'type': 'error', 'content': f"Unknown run id: {run_id}", 'run_id': run_id})
+                    continue
+                if run_id is not None and not run_state_store.claim(run_id):
+                    # e.g. the same run resumed from a second tab while it is still executing
+                    await session.send({'type': 'busy', 'content': f"Run {run_id} is already running", 'run_id': run_id})
+                    continue
+                session.interviewer = None
+                await start_consultation(content, run_id, bool(data.get('bypass_cache')))
+            elif data['type'] in ('interview', 'interview_answer', 'intake'):
+                if data['type'] == 'interview_answer' and session.interviewer is None:
+                    await session.send({'type': 'error', 'content': "No interview in progress"})
+                    continue
+                if data['type'] != 'interview_answer':
+                    # Created on demand, so sessions that send a query directly never build one
+                    session.interviewer = create_interviewer()
+                interview_step = asyncio.create_task(advance_interview(data))
+                waiters.add(interview_step)
+                interview_step.add_done_callback(waiters.discard)
+            elif data['type'] == 'cancel':
+                if interview_step is not None:
+                    interview_step.cancel()
+                session.interviewer = None
+                scheduler.cancel(session)
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
-        websocket_connections.remove(websocket)
+        scheduler.cancel(session)
+        for waiter in list(waiters):
+            waiter.cancel()
+        await session.close()
 
-async def index(request):
+async def index_page(request):
     with open('index.html', 'r') as f:
         return web.Response(text=f.read(), content_type='text/html')
 
+async def questionnaire_page(request):
+    # Keys for the answers of an {"type": "intake", "answers": {...}} websocket message
+    return web.json_response(questionnaire())
+
+async def metrics_page(request):
+    gauges = (
+        f"ceo_pro_scheduler_queue_depth {scheduler.queue_depth}\n"
+        f"ceo_pro_scheduler_running {len(scheduler.running)}\n"
+    ) + ''.join(
+        f'ceo_pro_provider_circuit_open{{provider="{name}"}} {int(provider.breaker.state != "closed")}\n'
+        for name, provider in providers.items()
+    )
+    return web.Response(text=registry.render_prometheus() + gauges, content_type='text/plain')
+
 async def main():
     app = web.Application()
-    app.router.add_get('/', index)
+    app.router.add_get('/', index_page)
+    app.router.add_get('/metrics', metrics_page)
+    app.router.add_get('/questionnaire', questionnaire_page)
     
     cors = aiohttp_cors.setup(app, defaults={
         "*": aiohttp_cors.ResourceOptions(
@@ -327,6 +927,10 @@ async def main():
 
     await site.start()
 
+    scheduler.start()
+    pruned = run_state_store.prune(RUN_STATE_RETENTION_DAYS * 86400)
+    if pruned:
+        log_to_file(f"Pruned {pruned} run checkpoint(s) older than {RUN_STATE_RETENTION_DAYS} days")
     ws_server = await websockets.serve(websocket_handler, '0.0.0.0', 8765)
 
     await capture_output("Server started. Open http://localhost:8080 in your browser.")
@@ -338,12 +942,14 @@ async def main():
             asyncio.Future()  # This future never completes, keeping the server running
         )
     finally:
+        await scheduler.stop()
+        pdf_service.close()
         await runner.cleanup()
 
-interviewer = BusinessInterviewer(GOOGLE_API_KEY)
-
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == 'cli':
-        asyncio.run(async_main_logic())
+        # python app.py cli [--resume <run_id>] [--no-cache]
+        resume_run_id = sys.argv[sys.argv.index('--resume') + 1] if '--resume' in sys.argv[2:-1] else None
+        asyncio.run(async_main_logic(run_id=resume_run_id, bypass_cache='--no-cache' in sys.argv))
     else:
         asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,491 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+# Stand-ins for the Gemini, OpenAI and Pinecone clients used by app.py, plus
+# record/replay wrappers around the real clients. install_fake_providers() and
+# install_recording_providers() patch the provider entry points and must run
+# before app is imported, because app builds its clients at import time.
+
+WORDS = (
+    "market revenue customers pricing growth margin strategy channel retention segment cost team "
+    "operations capital forecast competitors product brand demand supply hiring funding risk"
+).split()
+
+class FakeProviderConfig:
+    def __init__(self, ttft=0.4, chunk_chars=48, chunk_interval=0.02, response_words=900,
+                 continuation_words=300, generate_latency=0.3, embedding_latency=0.05,
+                 embedding_dimension=3072, query_latency=0.03, corpus_size=2000, error_rate=0.0):
+        self.ttft = ttft
+        self.chunk_chars = chunk_chars
+        self.chunk_interval = chunk_interval
+        self.response_words = response_words
+        self.continuation_words = continuation_words
+        self.generate_latency = generate_latency
+        self.embedding_latency = embedding_latency
+        self.embedding_dimension = embedding_dimension
+        self.query_latency = query_latency
+        self.corpus_size = corpus_size
+        # Share of provider requests that fail with a transient 503
+        self.error_rate = error_rate
+
+config = FakeProviderConfig()
+_errors = random.Random(0)
+
+class FakeServiceUnavailable(Exception):
+    status_code = 503
+
+def maybe_fail(provider):
+    if config.error_rate and _errors.random() < config.error_rate:
+        raise FakeServiceUnavailable(f"{provider} is temporarily unavailable (injected)")
+
+def _digest(*parts):
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+def _seed(*parts):
+    return int(_digest(*parts)[:16], 16)
+
+def _text(value):
+    if isinstance(value, str):
+        return value
+    parts = value['parts'] if isinstance(value, dict) else value.parts
+    return ''.join(part if isinstance(part, str) else getattr(part, 'text', '') for part in parts)
+
+def _role(value):
+    return value['role'] if isinstance(value, dict) else value.role
+
+def fake_markdown(seed, words):
+    # Deterministic report-like markdown ending on a full sentence
+    rng = random.Random(seed)
+    lines = []
+    written = 0
+    while written < words:
+        kind = rng.random()
+        if kind < 0.08:
+            lines.append(f"\n### {' '.join(rng.choice(WORDS) for _ in range(3)).title()}\n")
+        elif kind < 0.16:
+            lines.append(f"| {rng.choice(WORDS)} | {rng.randint(1, 999)} | {rng.choice(WORDS)} |")
+            written += 3
+            continue
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 24)))
+        lines.append(sentence.capitalize() + '.')
+        written += sentence.count(' ') + 1
+    return '\n'.join(lines).strip() + '\n\nThis concludes the analysis.'
+
+class _Part:
+    def __init__(self, text):
+        self.text = text
+
+class FinishReason:
+    def __init__(self, name):
+        self.name = name
+
+STOP = FinishReason('STOP')
+
+class _Candidate:
+    def __init__(self, finish_reason=None):
+        self.finish_reason = finish_reason
+
+class _Usage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+class FakeChunk:
+    def __init__(self, text, finish_reason=None, usage=None):
+        self.text = text
+        self.parts = [_Part(text)] if text else []
+        self.candidates = [_Candidate(finish_reason)]
+        self.usage_metadata = usage
+
+class FakeStreamingResponse:
+    def __init__(self, chunks, on_complete=None):
+        # chunks: [(delay_seconds, FakeChunk)]
+        self.chunks = chunks
+        self.on_complete = on_complete
+
+    async def __aiter__(self):
+        text = []
+        for delay, chunk in self.chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            text.append(chunk.text)
+            yield chunk
+        if self.on_complete is not None:
+            self.on_complete(''.join(text))
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+def synthetic_stream(prompt, history, model_name):
+    continuation = bool(history) and prompt.strip().lower().startswith("continue")
+    words = config.continuation_words if continuation else config.response_words
+    context = _text(history[-1]) if history else ''
+    text = fake_markdown(_seed(model_name, context[-200:], prompt), words)
+    pieces = [text[start:start + config.chunk_chars] for start in range(0, len(text), config.chunk_chars)]
+    usage = _Usage(_estimate_tokens(prompt) + sum(_estimate_tokens(_text(turn)) for turn in history), _estimate_tokens(text))
+    chunks = []
+    for number, piece in enumerate(pieces):
+        last = number == len(pieces) - 1
+        delay = config.ttft if number == 0 else config.chunk_interval
+        chunks.append((delay, FakeChunk(piece, STOP if last else None, usage if last else None)))
+    return chunks
+
+class FakeChat:
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def _complete(self, prompt, text):
+        self.history.append({'role': 'user', 'parts': [prompt]})
+        self.history.append({'role': 'model', 'parts': [text]})
+
+    async def send_message_async(self, prompt, stream=False, **kwargs):
+        maybe_fail("gemini")
+        chunks = self.model.stream_chunks(prompt, self.history)
+        response = FakeStreamingResponse(chunks, lambda text: self._complete(prompt, text))
+        if stream:
+            return response
+        parts = []
+        async for chunk in response:
+            parts.append(chunk.text)
+        return FakeChunk(''.join(parts), STOP, chunks[-1][1].usage_metadata if chunks else None)
+
+class FakeGenerativeModel:
+    def __init__(self, model_name='gemini-1.5-pro', **kwargs):
+        self.model_name = model_name
+
+    def stream_chunks(self, prompt, history):
+        return synthetic_stream(prompt, history, self.model_name)
+
+    def start_chat(self, history=None, **kwargs):
+        return FakeChat(self, history)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(config.generate_latency)
+        maybe_fail("gemini")
+        text = fake_markdown(_seed(self.model_name, _text(prompt)), 80)
+        return FakeChunk(text, STOP, _Usage(_estimate_tokens(_text(prompt)), _estimate_tokens(text)))
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(config.generate_latency)
+        text = fake_markdown(_seed(self.model_name, _text(prompt)), 80)
+        return FakeChunk(text, STOP, _Usage(_estimate_tokens(_text(prompt)), _estimate_tokens(text)))
+
+def fake_vector(model, text, dimension):
+    rng = np.random.default_rng(_seed(model, text))
+    return rng.standard_normal(dimension).astype(np.float32)
+
+class _EmbeddingItem:
+    def __init__(self, index, embedding):
+        self.index = index
+        self.embedding = embedding
+
+class _EmbeddingUsage:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+class _EmbeddingResponse:
+    def __init__(self, data, total_tokens):
+        self.data = data
+        self.usage = _EmbeddingUsage(total_tokens)
+
+class FakeEmbeddings:
+    async def create(self, input, model, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        await asyncio.sleep(config.embedding_latency)
+        maybe_fail("openai")
+        data = [_EmbeddingItem(i, fake_vector(model, text, config.embedding_dimension).tolist()) for i, text in enumerate(texts)]
+        return _EmbeddingResponse(data, sum(_estimate_tokens(text) for text in texts))
+
+class FakeAsyncOpenAI:
+    def __init__(self, **kwargs):
+        self.embeddings = FakeEmbeddings()
+
+class FakeIndex:
+    def __init__(self, name="fake"):
+        self.name = name
+
+    def describe_index_stats(self, **kwargs):
+        return {'dimension': config.embedding_dimension, 'total_vector_count': config.corpus_size,
+                'namespaces': {'pinecone': {'vector_count': config.corpus_size}}}
+
+    def query(self, vector=None, top_k=10, namespace=None, include_values=False, include_metadata=True, **kwargs):
+        time.sleep(config.query_latency)
+        maybe_fail("pinecone")
+        rng = random.Random(_seed(np.asarray(vector, dtype=np.float32).tobytes().hex()[:64]))
+        rows = rng.sample(range(config.corpus_size), min(top_k, config.corpus_size))
+        return {'matches': [
+            {'id': f"chunk-{row}", 'score': 0.9 - rank * 0.01,
+             'metadata': {'text': fake_markdown(row, 120)} if include_metadata else {}}
+            for rank, row in enumerate(rows)
+        ]}
+
+class FakePinecone:
+    def __init__(self, **kwargs):
+        pass
+
+    def Index(self, name=None, **kwargs):
+        return FakeIndex(name)
+
+class FixtureStore:
+    # JSON-lines file of recorded provider exchanges. Replay serves each request
+    # key in recorded order; requests that were never recorded fall back to the
+    # synthetic providers and are counted as misses.
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.misses = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        if mode == "replay":
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries[(entry['kind'], entry['key'])].append(entry['payload'])
+        else:
+            self._file = open(path, 'a')
+
+    def record(self, kind, key, payload):
+        with self._lock:
+            self._file.write(json.dumps({'kind': kind, 'key': key, 'payload': payload}) + '\n')
+            self._file.flush()
+
+    def lookup(self, kind, key):
+        with self._lock:
+            entries = self._entries.get((kind, key))
+            if not entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            payload = entries.popleft() if len(entries) > 1 else entries[0]
+            return payload
+
+    def close(self):
+        if self.mode == "record":
+            self._file.close()
+
+def _stream_key(model_name, prompt, history):
+    # The latest user turn and the turn count pin down continuation prompts, which repeat
+    last_user = next((_text(turn) for turn in reversed(history) if _role(turn) == 'user'), '')
+    return _digest(model_name, str(len(history)), last_user, prompt)
+
+def _vector_key(vector):
+    return hashlib.sha256(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()
+
+class _RecordingStream:
+    def __init__(self, response, store, key):
+        self.response = response
+        self.store = store
+        self.key = key
+
+    async def __aiter__(self):
+        chunks = []
+        last = time.perf_counter()
+        async for chunk in self.response:
+            now = time.perf_counter()
+            usage = getattr(chunk, 'usage_metadata', None)
+            finish_reason = chunk.candidates[0].finish_reason if chunk.candidates else None
+            chunks.append({
+                'delay': now - last,
+                'text': chunk.text if chunk.parts else '',
+                'finish_reason': getattr(finish_reason, 'name', str(finish_reason)) if finish_reason else None,
+                'usage': [usage.prompt_token_count, usage.candidates_token_count] if usage else None,
+            })
+            last = now
+            yield chunk
+        self.store.record('stream', self.key, chunks)
+
+class _RecordingChat:
+    def __init__(self, chat, model_name, store):
+        self._chat = chat
+        self._model_name = model_name
+        self._store = store
+
+    @property
+    def history(self):
+        return self._chat.history
+
+    @history.setter
+    def history(self, value):
+        self._chat.history = value
+
+    async def send_message_async(self, prompt, stream=False, **kwargs):
+        key = _stream_key(self._model_name, prompt, self._chat.history)
+        response = await self._chat.send_message_async(prompt, stream=True, **kwargs)
+        return _RecordingStream(response, self._store, key)
+
+def recording_model_class(real_class, store):
+    class RecordingGenerativeModel:
+        def __init__(self, model_name='gemini-1.5-pro', **kwargs):
+            self.model_name = model_name
+            self._model = real_class(model_name, **kwargs)
+
+        def start_chat(self, history=None, **kwargs):
+            return _RecordingChat(self._model.start_chat(history=history or [], **kwargs), self.model_name, store)
+
+        async def generate_content_async(self, prompt, **kwargs):
+            start = time.perf_counter()
+            response = await self._model.generate_content_async(prompt, **kwargs)
+            usage = getattr(response, 'usage_metadata', None)
+            store.record('generate', _digest(self.model_name, _text(prompt)), {
+                'elapsed': time.perf_counter() - start,
+                'text': response.text if response.parts else '',
+                'usage': [usage.prompt_token_count, usage.candidates_token_count] if usage else None,
+            })
+            return response
+
+    return RecordingGenerativeModel
+
+def replay_model_class(store):
+    class ReplayGenerativeModel(FakeGenerativeModel):
+        def stream_chunks(self, prompt, history):
+            recorded = store.lookup('stream', _stream_key(self.model_name, prompt, history))
+            if recorded is None:
+                return super().stream_chunks(prompt, history)
+            return [
+                (chunk['delay'], FakeChunk(
+                    chunk['text'],
+                    FinishReason(chunk['finish_reason']) if chunk['finish_reason'] else None,
+                    _Usage(*chunk['usage']) if chunk['usage'] else None
+                ))
+                for chunk in recorded
+            ]
+
+        async def generate_content_async(self, prompt, **kwargs):
+            recorded = store.lookup('generate', _digest(self.model_name, _text(prompt)))
+            if recorded is None:
+                return await super().generate_content_async(prompt, **kwargs)
+            await asyncio.sleep(recorded['elapsed'])
+            return FakeChunk(recorded['text'], STOP, _Usage(*recorded['usage']) if recorded['usage'] else None)
+
+    return ReplayGenerativeModel
+
+class _RecordingEmbeddings:
+    def __init__(self, embeddings, store):
+        self._embeddings = embeddings
+        self._store = store
+
+    async def create(self, input, model, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        start = time.perf_counter()
+        response = await self._embeddings.create(input=input, model=model, **kwargs)
+        elapsed = (time.perf_counter() - start) / max(1, len(texts))
+        for item in response.data:
+            self._store.record('embedding', _digest(model, texts[item.index]), {'elapsed': elapsed, 'embedding': list(item.embedding)})
+        return response
+
+class _ReplayEmbeddings(FakeEmbeddings):
+    def __init__(self, store):
+        self._store = store
+
+    async def create(self, input, model, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        data = []
+        delay = 0.0
+        for i, text in enumerate(texts):
+            recorded = self._store.lookup('embedding', _digest(model, text))
+            if recorded is None:
+                data.append(_EmbeddingItem(i, fake_vector(model, text, config.embedding_dimension).tolist()))
+                delay = max(delay, config.embedding_latency)
+            else:
+                data.append(_EmbeddingItem(i, recorded['embedding']))
+                delay = max(delay, recorded['elapsed'])
+        await asyncio.sleep(delay)
+        return _EmbeddingResponse(data, sum(_estimate_tokens(text) for text in texts))
+
+def recording_openai_class(real_class, store):
+    class RecordingAsyncOpenAI:
+        def __init__(self, **kwargs):
+            self._client = real_class(**kwargs)
+            self.embeddings = _RecordingEmbeddings(self._client.embeddings, store)
+
+    return RecordingAsyncOpenAI
+
+def replay_openai_class(store):
+    class ReplayAsyncOpenAI:
+        def __init__(self, **kwargs):
+            self.embeddings = _ReplayEmbeddings(store)
+
+    return ReplayAsyncOpenAI
+
+def _plain(value):
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return value
+
+class _RecordingIndex:
+    def __init__(self, index, store):
+        self._index = index
+        self._store = store
+
+    def describe_index_stats(self, **kwargs):
+        stats = _plain(self._index.describe_index_stats(**kwargs))
+        self._store.record('stats', 'stats', stats)
+        return stats
+
+    def query(self, vector=None, top_k=10, **kwargs):
+        start = time.perf_counter()
+        result = _plain(self._index.query(vector=vector, top_k=top_k, **kwargs))
+        self._store.record('query', _digest(_vector_key(vector), str(top_k)), {'elapsed': time.perf_counter() - start, 'result': result})
+        return result
+
+class _ReplayIndex(FakeIndex):
+    def __init__(self, store, name=None):
+        super().__init__(name)
+        self._store = store
+
+    def describe_index_stats(self, **kwargs):
+        return self._store.lookup('stats', 'stats') or super().describe_index_stats(**kwargs)
+
+    def query(self, vector=None, top_k=10, **kwargs):
+        recorded = self._store.lookup('query', _digest(_vector_key(vector), str(top_k)))
+        if recorded is None:
+            return super().query(vector=vector, top_k=top_k, **kwargs)
+        time.sleep(recorded['elapsed'])
+        return recorded['result']
+
+def recording_pinecone_class(real_class, store):
+    class RecordingPinecone:
+        def __init__(self, **kwargs):
+            self._client = real_class(**kwargs)
+
+        def Index(self, name=None, **kwargs):
+            return _RecordingIndex(self._client.Index(name, **kwargs), store)
+
+    return RecordingPinecone
+
+def replay_pinecone_class(store):
+    class ReplayPinecone(FakePinecone):
+        def Index(self, name=None, **kwargs):
+            return _ReplayIndex(store, name)
+
+    return ReplayPinecone
+
+def install_fake_providers(store=None):
+    import google.generativeai as genai
+    import openai
+    import pinecone
+    if store is None:
+        genai.GenerativeModel = FakeGenerativeModel
+        openai.AsyncOpenAI = FakeAsyncOpenAI
+        pinecone.Pinecone = FakePinecone
+    else:
+        genai.GenerativeModel = replay_model_class(store)
+        openai.AsyncOpenAI = replay_openai_class(store)
+        pinecone.Pinecone = replay_pinecone_class(store)
+
+def install_recording_providers(store):
+    import google.generativeai as genai
+    import openai
+    import pinecone
+    genai.GenerativeModel = recording_model_class(genai.GenerativeModel, store)
+    openai.AsyncOpenAI = recording_openai_class(openai.AsyncOpenAI, store)
+    pinecone.Pinecone = recording_pinecone_class(pinecone.Pinecone, store)
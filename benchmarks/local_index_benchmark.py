@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_index import LocalVectorIndex, write_snapshot
+
+def synthetic_snapshot(snapshot_dir, count, dimension, clusters, seed):
+    # Clustered data so that the approximate index has structure to exploit, like a real corpus
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    write_snapshot(snapshot_dir, [f"doc-{i}" for i in range(count)], vectors, [{'text': f"passage {i}"} for i in range(count)])
+    return centers
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+def run(snapshot_dir, queries, top_k, n_lists, nprobes):
+    exact = LocalVectorIndex(snapshot_dir, mode="exact")
+    start = time.perf_counter()
+    exact.build_ivf(n_lists)
+    print(f"Index: {exact.count} x {exact.dimension}, IVF build with {len(exact.centroids)} lists took {time.perf_counter() - start:.2f}s")
+
+    truth = []
+    exact_latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = exact.search(query, top_k)
+        exact_latencies.append(time.perf_counter() - start)
+        truth.append(set(rows.tolist()))
+    print(f"{'brute force':<16} recall@{top_k}=1.000  p50={percentile_ms(exact_latencies, 50):7.2f}ms  p99={percentile_ms(exact_latencies, 99):7.2f}ms")
+
+    ivf = LocalVectorIndex(snapshot_dir, mode="ivf")
+    for nprobe in nprobes:
+        ivf.nprobe = nprobe
+        latencies = []
+        recalls = []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            rows, _ = ivf.search(query, top_k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(expected & set(rows.tolist())) / len(expected))
+        print(f"{f'ivf nprobe={nprobe}':<16} recall@{top_k}={np.mean(recalls):.3f}  p50={percentile_ms(latencies, 50):7.2f}ms  p99={percentile_ms(latencies, 99):7.2f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare IVF recall and latency against brute-force search")
+    parser.add_argument("--snapshot", help="Existing snapshot directory (default: generate a synthetic corpus)")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=12)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed + 1)
+    with tempfile.TemporaryDirectory() as scratch:
+        snapshot_dir = args.snapshot
+        if snapshot_dir is None:
+            snapshot_dir = scratch
+            synthetic_snapshot(snapshot_dir, args.count, args.dimension, args.clusters, args.seed)
+        index = LocalVectorIndex(snapshot_dir)
+        # Queries are perturbed corpus rows, which is how real retrieval queries relate to the corpus
+        rows = rng.choice(index.count, args.queries, replace=False)
+        queries = np.asarray(index.vectors[np.sort(rows)]) + 0.05 * rng.standard_normal((args.queries, index.dimension)).astype(np.float32)
+        run(snapshot_dir, queries, args.top_k, args.lists, args.nprobe)
@@ -0,0 +1,71 @@
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_conversion import PdfRenderer
+
+def line_by_line_preprocess(content):
+    # The original per-line implementation, kept here as the baseline
+    processed_lines = []
+    for line in content.split('\n'):
+        line = re.sub(r'^Assistant:\s*', '', line)
+        if line.startswith('### '):
+            processed_lines.append('<div class="page-break"></div>')
+            processed_lines.append(f'# {line[4:].strip()}')
+        else:
+            processed_lines.append(line)
+    return '\n'.join(processed_lines)
+
+def synthetic_transcript(lines, seed):
+    # Roughly the mix of a consultation transcript: prose, headings, tables and role prefixes
+    rng = random.Random(seed)
+    words = "market revenue customers pricing growth margin strategy channel retention segment cost team".split()
+    templates = [
+        lambda: ' '.join(rng.choice(words) for _ in range(rng.randint(8, 30))),
+        lambda: f"### {' '.join(rng.choice(words) for _ in range(3)).title()}",
+        lambda: f"| {rng.choice(words)} | {rng.randint(1, 999)} | {rng.choice(words)} |",
+        lambda: f"Assistant: {' '.join(rng.choice(words) for _ in range(12))}",
+        lambda: f"User: {' '.join(rng.choice(words) for _ in range(10))}",
+        lambda: "",
+    ]
+    weights = [50, 4, 10, 3, 3, 30]
+    return '\n'.join(rng.choices(templates, weights)[0]() for _ in range(lines))
+
+def time_ms(func, content, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure PDF export preprocessing and rendering time per transcript")
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--render", action="store_true", help="Also time the full markdown + WeasyPrint render")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    content = synthetic_transcript(args.lines, args.seed)
+    renderer = PdfRenderer()
+    assert renderer.preprocess(content) == line_by_line_preprocess(content)
+
+    baseline = time_ms(line_by_line_preprocess, content, args.repeat)
+    single_pass = time_ms(renderer.preprocess, content, args.repeat)
+    print(f"{args.lines}-line transcript ({len(content) / 1024:.0f} KiB), median of {args.repeat}:")
+    print(f"{'line-by-line preprocess':<26} {baseline:8.2f} ms")
+    print(f"{'single-pass preprocess':<26} {single_pass:8.2f} ms  ({baseline / single_pass:.1f}x)")
+
+    if args.render:
+        with tempfile.TemporaryDirectory() as scratch:
+            pdf_path = os.path.join(scratch, "transcript.pdf")
+            render = lambda text: renderer.render(text, pdf_path)
+            print(f"{'full render':<26} {time_ms(render, content, max(1, args.repeat // 10)):8.2f} ms")
@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_providers
+from fake_providers import FixtureStore, install_fake_providers, install_recording_providers
+
+QUERIES = [
+    "We run a regional bakery chain with $4M revenue and thin margins. How do we grow profitably?",
+    "Our B2B SaaS startup has 40 customers and 18 months of runway. What should we prioritize?",
+    "We are a family-owned hardware store facing competition from big-box retailers. What are our options?",
+    "Our logistics company wants to expand into cold-chain delivery. Is it worth it and how?",
+]
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+class FakeWebSocket:
+    # Sends one consultation request and stays open until the server reports the outcome
+    def __init__(self, messages):
+        self.messages = messages
+        self.sent = []
+        self.first_stream_at = None
+        self.finished = asyncio.Event()
+        self.outcome = None
+
+    async def send(self, message):
+        data = json.loads(message)
+        if data['type'] == 'stream' and self.first_stream_at is None:
+            self.first_stream_at = time.perf_counter()
+        elif data['type'] in ('complete', 'cancelled', 'error', 'busy'):
+            self.outcome = data['type']
+            self.finished.set()
+        self.sent.append(data['type'])
+
+    async def close(self, code=1000, reason=""):
+        self.outcome = self.outcome or f"closed {code}"
+        self.finished.set()
+
+    async def __aiter__(self):
+        for message in self.messages:
+            yield json.dumps(message)
+        await self.finished.wait()
+
+async def monitor_loop_lag(interval, samples, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+async def run_clients(app, mode, clients, samples):
+    from session import ConsultationSession, current_session
+    from stream_fanout import StreamFanout
+
+    async def direct_client(number):
+        # A streamed session without subscribers, so fan-out work is still exercised
+        session = ConsultationSession(app.downloads_folder, stream=StreamFanout())
+        current_session.set(session)
+        start = time.perf_counter()
+        await app.async_main_logic(QUERIES[number % len(QUERIES)] + f" (client {number})")
+        samples['consultation'].append(time.perf_counter() - start)
+        await session.close()
+        return "complete"
+
+    async def websocket_client(number):
+        websocket = FakeWebSocket([{'type': 'message', 'content': QUERIES[number % len(QUERIES)] + f" (client {number})"}])
+        start = time.perf_counter()
+        await app.websocket_handler(websocket, "/")
+        samples['consultation'].append(time.perf_counter() - start)
+        if websocket.first_stream_at is not None:
+            samples['client_first_stream'].append(websocket.first_stream_at - start)
+        return websocket.outcome
+
+    client = direct_client if mode == "main" else websocket_client
+    return await asyncio.gather(*[client(number) for number in range(clients)], return_exceptions=True)
+
+async def benchmark(app, args):
+    import tracing
+    from session import ConsultationScheduler
+
+    samples = defaultdict(list)
+    record_span = tracing.registry.record_span
+
+    def collect(span):
+        samples[f"span:{span.name}"].append(span.duration)
+        if span.attributes.get('ttft') is not None:
+            samples[f"ttft:{span.name}"].append(span.attributes['ttft'])
+        record_span(span)
+
+    tracing.registry.record_span = collect
+    app.scheduler = ConsultationScheduler(args.max_concurrent or args.clients, args.clients)
+    app.scheduler.start()
+
+    stop = asyncio.Event()
+    lag = []
+    monitor = asyncio.create_task(monitor_loop_lag(args.lag_interval, lag, stop))
+    start = time.perf_counter()
+    outcomes = await run_clients(app, args.mode, args.clients, samples)
+    wall_clock = time.perf_counter() - start
+    stop.set()
+    await monitor
+    await app.scheduler.stop()
+    app.pdf_service.close()
+    return wall_clock, outcomes, samples, lag
+
+def report(args, wall_clock, outcomes, samples, lag, store):
+    failures = [outcome for outcome in outcomes if outcome != "complete"]
+    results = {
+        'mode': args.mode,
+        'clients': args.clients,
+        'wall_clock_seconds': round(wall_clock, 3),
+        'failures': [str(outcome) for outcome in failures],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'loop_lag_ms': {
+            'p50': round(percentile(lag, 50) * 1000, 2),
+            'p99': round(percentile(lag, 99) * 1000, 2),
+            'max': round(max(lag, default=0.0) * 1000, 2),
+        },
+        'latency_seconds': {
+            name: {
+                'count': len(values),
+                'p50': round(percentile(values, 50), 4),
+                'p99': round(percentile(values, 99), 4),
+                'mean': round(statistics.mean(values), 4),
+            }
+            for name, values in sorted(samples.items())
+        },
+    }
+    if tracemalloc.is_tracing():
+        results['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+    if store is not None:
+        results['fixtures'] = {'mode': store.mode, 'hits': store.hits, 'misses': store.misses}
+    results['providers'] = {name: provider.stats() for name, provider in args.app.providers.items()}
+    results['model_routing'] = args.app.model_router.stats()
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+        return failures
+    print(f"{args.clients} client(s), {args.mode} mode: wall clock {results['wall_clock_seconds']:.2f}s, "
+          f"{len(failures)} failure(s), peak RSS {results['peak_rss_mb']} MB"
+          + (f", peak traced {results['peak_traced_mb']} MB" if 'peak_traced_mb' in results else ""))
+    print(f"event loop lag: p50 {results['loop_lag_ms']['p50']}ms  p99 {results['loop_lag_ms']['p99']}ms  max {results['loop_lag_ms']['max']}ms")
+    for name, values in results['latency_seconds'].items():
+        print(f"{name:<32} n={values['count']:<5} p50={values['p50']:8.3f}s  p99={values['p99']:8.3f}s")
+    for name, stats in results['providers'].items():
+        print(f"provider {name:<10} {stats}")
+    print(f"model routing: {results['model_routing']['downgrades']} downgrade(s)")
+    if store is not None:
+        print(f"fixtures ({store.mode}): {store.hits} hits, {store.misses} misses")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the consultation pipeline end to end against fake or recorded providers")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--mode", choices=("main", "websocket"), default="websocket",
+                        help="Call async_main_logic directly or go through websocket_handler and the scheduler")
+    parser.add_argument("--max-concurrent", type=int, default=None, help="Scheduler concurrency (default: one slot per client)")
+    parser.add_argument("--sequential-stages", action="store_true")
+    parser.add_argument("--stage-cache", action="store_true", help="Keep the stage output cache enabled")
+    parser.add_argument("--ttft", type=float, default=fake_providers.config.ttft)
+    parser.add_argument("--chunk-chars", type=int, default=fake_providers.config.chunk_chars)
+    parser.add_argument("--chunk-interval", type=float, default=fake_providers.config.chunk_interval)
+    parser.add_argument("--response-words", type=int, default=fake_providers.config.response_words)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake provider requests that fail with a 503")
+    parser.add_argument("--lag-interval", type=float, default=0.01)
+    parser.add_argument("--record", metavar="FIXTURES", help="Use the real providers (keys from app.py) and record their responses")
+    parser.add_argument("--replay", metavar="FIXTURES", help="Serve provider calls from a recorded fixture file")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report peak traced Python memory (slower)")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own console output")
+    parser.add_argument("--max-wall-clock", type=float, default=None, help="Exit non-zero if the run is slower, for CI")
+    args = parser.parse_args()
+
+    fake_providers.config.ttft = args.ttft
+    fake_providers.config.chunk_chars = args.chunk_chars
+    fake_providers.config.chunk_interval = args.chunk_interval
+    fake_providers.config.response_words = args.response_words
+    fake_providers.config.error_rate = args.error_rate
+
+    store = None
+    if args.record:
+        store = FixtureStore(args.record, "record")
+        install_recording_providers(store)
+    else:
+        store = FixtureStore(args.replay, "replay") if args.replay else None
+        install_fake_providers(store)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as home:
+        # app resolves its cache and download folders from HOME at import time
+        os.environ['HOME'] = home
+        os.makedirs(os.path.join(home, "Downloads"))
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            import app
+
+            if not args.verbose:
+                logging.getLogger().setLevel(logging.WARNING)
+            app.PARALLEL_STAGES = not args.sequential_stages
+            if not args.stage_cache:
+                app.stage_cache = None
+            wall_clock, outcomes, samples, lag = asyncio.run(benchmark(app, args))
+            args.app = app
+            app.log_writer.close()
+
+    failures = report(args, wall_clock, outcomes, samples, lag, store)
+    if store is not None:
+        store.close()
+    if failures or (args.max_wall_clock is not None and wall_clock > args.max_wall_clock):
+        sys.exit(1)
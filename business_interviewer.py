@@ -1,139 +1,211 @@
 import google.generativeai as genai
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import json
 
+DEFAULT_MODEL = 'gemini-1.5-pro'
+
+WELCOME_MESSAGE = (
+    "Welcome to CEO-Pro!\n"
+    "I'm here to gather information about your business and help provide valuable insights.\n"
+    "Would you like to provide a detailed query upfront or go through a guided interview process?"
+)
+
+# (section introduction, [(answer key, question)]) in the order they are asked
+INTERVIEW_SECTIONS: List[Tuple[str, List[Tuple[str, str]]]] = [
+    ("Let's start with an overview of your company.", [
+        ('company_name', "What is your company's name?"),
+        ('industry', "What industry are you in?"),
+        ('years_in_operation', "How many years has your company been operating?"),
+        ('employee_count', "Approximately how many employees do you have?"),
+        ('annual_revenue', "What is your approximate annual revenue?"),
+        ('geographical_presence', "Describe your geographical presence (local, national, international)"),
+    ]),
+    ("Now, let's discuss your market position.", [
+        ('market_share', "What is your estimated market share?"),
+        ('main_competitors', "Who are your main competitors?"),
+        ('unique_selling_proposition', "What is your unique selling proposition?"),
+        ('target_customers', "Describe your target customer segments"),
+    ]),
+    ("Let's talk about your company's financial health.", [
+        ('profit_margins', "What are your current profit margins?"),
+        ('debt_to_equity_ratio', "What is your company's debt-to-equity ratio?"),
+        ('cash_flow_status', "How would you describe your current cash flow status?"),
+        ('recent_financial_trends', "What are the recent financial trends in your business?"),
+    ]),
+    ("Now, let's discuss your operational information.", [
+        ('key_products_services', "What are your key products or services?"),
+        ('supply_chain_overview', "Can you provide a brief overview of your supply chain?"),
+        ('operational_challenges', "What are your major operational challenges?"),
+        ('recent_operational_changes', "Have there been any recent or planned major changes in operations?"),
+    ]),
+    ("Let's talk about your human resources.", [
+        ('employee_satisfaction', "How would you rate your employee satisfaction levels?"),
+        ('turnover_rate', "What is your current employee turnover rate?"),
+        ('key_skills_gaps', "Are there any key skills or talent gaps in your organization?"),
+        ('organizational_structure', "Can you briefly describe your organizational structure?"),
+    ]),
+    ("Let's discuss technology and innovation in your company.", [
+        ('tech_adoption_state', "How would you describe your current state of technology adoption?"),
+        ('rd_initiatives', "What are your current R&D initiatives?"),
+        ('innovation_pipeline', "Can you describe your innovation pipeline?"),
+    ]),
+    ("Now, let's talk about your regulatory environment.", [
+        ('key_regulations', "What are the key regulations affecting your business?"),
+        ('compliance_challenges', "What are your main compliance challenges?"),
+        ('upcoming_regulatory_changes', "Are there any upcoming regulatory changes that concern you?"),
+    ]),
+    ("Let's discuss your current business challenges.", [
+        ('immediate_issues', "What are your most pressing immediate issues?"),
+        ('long_term_concerns', "What are your long-term strategic concerns?"),
+        ('advice_needed', "In which specific areas do you need advice?"),
+    ]),
+    ("Let's talk about your growth and expansion plans.", [
+        ('current_growth_strategies', "What are your current growth strategies?"),
+        ('potential_new_markets', "Are there any potential new markets or products you're considering?"),
+        ('ma_plans', "Do you have any merger or acquisition plans?"),
+    ]),
+    ("Now, let's discuss your customer insights.", [
+        ('customer_satisfaction', "What are your current customer satisfaction metrics?"),
+        ('churn_rate', "What is your customer churn rate?"),
+        ('acquisition_costs', "What are your customer acquisition costs?"),
+        ('customer_lifetime_value', "What is the average lifetime value of your customers?"),
+    ]),
+    ("Let's talk about sustainability and corporate social responsibility.", [
+        ('sustainability_initiatives', "What are your current sustainability initiatives?"),
+        ('esg_goals', "What are your ESG (Environmental, Social, Governance) goals?"),
+        ('community_engagement', "How does your company engage with the community?"),
+    ]),
+    ("Finally, let's discuss your competitive landscape.", [
+        ('recent_competitive_changes', "What recent changes have you observed in your competitive environment?"),
+        ('emerging_threats', "Are there any emerging threats or opportunities in your industry?"),
+        ('industry_leaders', "How do you benchmark against industry leaders?"),
+    ]),
+]
+
+# Flattened to (section introduction or None, key, question)
+QUESTIONS = [
+    (intro if number == 0 else None, key, question)
+    for intro, section in INTERVIEW_SECTIONS
+    for number, (key, question) in enumerate(section)
+]
+QUESTION_KEYS = [key for _, key, _ in QUESTIONS]
+
+def questionnaire() -> List[Dict[str, Any]]:
+    # The questions as served to API clients that submit all answers at once
+    return [
+        {'section': intro, 'questions': [{'key': key, 'question': question} for key, question in section]}
+        for intro, section in INTERVIEW_SECTIONS
+    ]
+
+class InterviewStep:
+    def __init__(self, state: str, message: str = "", question: Optional[str] = None, key: Optional[str] = None,
+                 progress: Optional[Tuple[int, int]] = None, result: Optional[str] = None):
+        self.state = state
+        self.message = message
+        self.question = question
+        self.key = key
+        self.progress = progress
+        self.result = result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'message': self.message,
+            'question': self.question,
+            'key': self.key,
+            'progress': list(self.progress) if self.progress else None,
+        }
+
 class BusinessInterviewer:
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
-        self.chat = self.model.start_chat(history=[])
+    # Interview state machine: start() and answer() each return the next InterviewStep, so
+    # the same interview can be driven from a terminal or over a websocket without blocking.
+    # submit() takes the whole questionnaire (or a free-form query) in one payload.
+    # States: "choose" -> "query" or "question"... -> "confirm" -> "done".
+    def __init__(self, router=None, provider=None):
+        self.router = router
+        self.provider = provider
+        self.state = "new"
         self.business_info: Dict[str, Any] = {}
-
-    def conduct_interview(self) -> str:
-        print("Welcome to CEO-Pro!")
-        print("I'm here to gather information about your business and help provide valuable insights.")
-        print("Would you like to provide a detailed query upfront or go through a guided interview process?")
-        choice = input("Enter 'query' for upfront query or 'interview' for guided process: ").lower()
-
-        if choice == 'query':
-            return self.handle_upfront_query()
-        elif choice == 'interview':
-            return self.guided_interview()
+        self.history: List[Any] = []
+        self.result: Optional[str] = None
+        self._position = 0
+
+    def start(self) -> InterviewStep:
+        self.state = "choose"
+        return InterviewStep("choose", WELCOME_MESSAGE, "Enter 'query' for upfront query or 'interview' for guided process")
+
+    async def answer(self, text: str) -> InterviewStep:
+        text = text.strip()
+        if self.state == "choose":
+            if text.lower() == 'query':
+                self.state = "query"
+                return InterviewStep("query", question="Please provide your detailed business query or scenario")
+            return self._begin_questions("" if text.lower() == 'interview' else "Invalid choice. Proceeding with guided interview.")
+        if self.state == "query":
+            return await self._finish(text)
+        if self.state == "question":
+            self.business_info[QUESTIONS[self._position][1]] = text
+            self._position += 1
+            if self._position < len(QUESTIONS):
+                return self._question_step()
+            return await self._summarize()
+        if self.state == "confirm":
+            if text.lower() == 'yes':
+                return await self._finish(json.dumps(self.business_info, indent=2))
+            return self._begin_questions("I apologize for any inaccuracies. Let's go through the information again to make corrections.")
+        raise ValueError(f"The interview is in state {self.state!r} and is not expecting an answer")
+
+    async def submit(self, payload: Dict[str, Any]) -> InterviewStep:
+        # Batch intake: {"query": "..."} or {"answers": {key: answer, ...}} with keys from
+        # QUESTION_KEYS; unanswered questions are left out. Skips the confirmation step.
+        if payload.get('query'):
+            return await self._finish(str(payload['query']))
+        answers = payload.get('answers')
+        if not isinstance(answers, dict) or not answers:
+            raise ValueError("Intake needs a 'query' string or a non-empty 'answers' object")
+        unknown = sorted(set(answers) - set(QUESTION_KEYS))
+        if unknown:
+            raise ValueError(f"Unknown questionnaire keys: {', '.join(unknown)}")
+        self.business_info = {key: str(answers[key]) for key in QUESTION_KEYS if key in answers}
+        return await self._finish(json.dumps(self.business_info, indent=2))
+
+    async def conduct_interview(self, ask: Callable[[str], Awaitable[str]], say: Callable[[str], Awaitable[Any]]) -> str:
+        # Terminal driver: ask(prompt) returns the user's answer, say(text) shows a message
+        step = self.start()
+        while step.state != "done":
+            if step.message:
+                await say(step.message)
+            step = await self.answer(await ask(f"{step.question}: "))
+        await say(step.message)
+        return step.result
+
+    def _begin_questions(self, message: str) -> InterviewStep:
+        self.state = "question"
+        self._position = 0
+        return self._question_step(message)
+
+    def _question_step(self, message: str = "") -> InterviewStep:
+        intro, key, question = QUESTIONS[self._position]
+        if intro:
+            message = f"{message}\n\n{intro}".strip()
+        return InterviewStep("question", message, question, key, (self._position + 1, len(QUESTIONS)))
+
+    async def _send(self, task: str, prompt: str) -> str:
+        # Each step runs on the model routed for it, continuing the same conversation
+        route = self.router.route(task) if self.router is not None else None
+        model = genai.GenerativeModel(
+            route.model if route is not None else DEFAULT_MODEL,
+            generation_config=route.generation_config if route is not None else None
+        )
+        chat = model.start_chat(history=self.history)
+        if self.provider is not None:
+            response = await self.provider.call(lambda: chat.send_message_async(prompt))
         else:
-            print("Invalid choice. Proceeding with guided interview.")
-            return self.guided_interview()
-
-    def handle_upfront_query(self) -> str:
-        query = input("Please provide your detailed business query or scenario: ")
-        return self.process_query(query)
-
-    def guided_interview(self) -> str:
-        interview_sections = [
-            self.company_overview,
-            self.market_position,
-            self.financial_health,
-            self.operational_information,
-            self.human_resources,
-            self.technology_and_innovation,
-            self.regulatory_environment,
-            self.current_challenges,
-            self.growth_plans,
-            self.customer_insights,
-            self.sustainability,
-            self.competitive_landscape
-        ]
-
-        for section in interview_sections:
-            section()
-
-        return self.summarize_and_process()
-
-    def ask_question(self, question: str) -> str:
-        return input(f"{question}: ")
-
-    def company_overview(self):
-        print("\nLet's start with an overview of your company.")
-        self.business_info['company_name'] = self.ask_question("What is your company's name?")
-        self.business_info['industry'] = self.ask_question("What industry are you in?")
-        self.business_info['years_in_operation'] = self.ask_question("How many years has your company been operating?")
-        self.business_info['employee_count'] = self.ask_question("Approximately how many employees do you have?")
-        self.business_info['annual_revenue'] = self.ask_question("What is your approximate annual revenue?")
-        self.business_info['geographical_presence'] = self.ask_question("Describe your geographical presence (local, national, international)")
-
-    def market_position(self):
-        print("\nNow, let's discuss your market position.")
-        self.business_info['market_share'] = self.ask_question("What is your estimated market share?")
-        self.business_info['main_competitors'] = self.ask_question("Who are your main competitors?")
-        self.business_info['unique_selling_proposition'] = self.ask_question("What is your unique selling proposition?")
-        self.business_info['target_customers'] = self.ask_question("Describe your target customer segments")
-
-    def financial_health(self):
-        print("\nLet's talk about your company's financial health.")
-        self.business_info['profit_margins'] = self.ask_question("What are your current profit margins?")
-        self.business_info['debt_to_equity_ratio'] = self.ask_question("What is your company's debt-to-equity ratio?")
-        self.business_info['cash_flow_status'] = self.ask_question("How would you describe your current cash flow status?")
-        self.business_info['recent_financial_trends'] = self.ask_question("What are the recent financial trends in your business?")
-
-    def operational_information(self):
-        print("\nNow, let's discuss your operational information.")
-        self.business_info['key_products_services'] = self.ask_question("What are your key products or services?")
-        self.business_info['supply_chain_overview'] = self.ask_question("Can you provide a brief overview of your supply chain?")
-        self.business_info['operational_challenges'] = self.ask_question("What are your major operational challenges?")
-        self.business_info['recent_operational_changes'] = self.ask_question("Have there been any recent or planned major changes in operations?")
-
-    def human_resources(self):
-        print("\nLet's talk about your human resources.")
-        self.business_info['employee_satisfaction'] = self.ask_question("How would you rate your employee satisfaction levels?")
-        self.business_info['turnover_rate'] = self.ask_question("What is your current employee turnover rate?")
-        self.business_info['key_skills_gaps'] = self.ask_question("Are there any key skills or talent gaps in your organization?")
-        self.business_info['organizational_structure'] = self.ask_question("Can you briefly describe your organizational structure?")
-
-    def technology_and_innovation(self):
-        print("\nLet's discuss technology and innovation in your company.")
-        self.business_info['tech_adoption_state'] = self.ask_question("How would you describe your current state of technology adoption?")
-        self.business_info['rd_initiatives'] = self.ask_question("What are your current R&D initiatives?")
-        self.business_info['innovation_pipeline'] = self.ask_question("Can you describe your innovation pipeline?")
-
-    def regulatory_environment(self):
-        print("\nNow, let's talk about your regulatory environment.")
-        self.business_info['key_regulations'] = self.ask_question("What are the key regulations affecting your business?")
-        self.business_info['compliance_challenges'] = self.ask_question("What are your main compliance challenges?")
-        self.business_info['upcoming_regulatory_changes'] = self.ask_question("Are there any upcoming regulatory changes that concern you?")
-
-    def current_challenges(self):
-        print("\nLet's discuss your current business challenges.")
-        self.business_info['immediate_issues'] = self.ask_question("What are your most pressing immediate issues?")
-        self.business_info['long_term_concerns'] = self.ask_question("What are your long-term strategic concerns?")
-        self.business_info['advice_needed'] = self.ask_question("In which specific areas do you need advice?")
-
-    def growth_plans(self):
-        print("\nLet's talk about your growth and expansion plans.")
-        self.business_info['current_growth_strategies'] = self.ask_question("What are your current growth strategies?")
-        self.business_info['potential_new_markets'] = self.ask_question("Are there any potential new markets or products you're considering?")
-        self.business_info['ma_plans'] = self.ask_question("Do you have any merger or acquisition plans?")
-
-    def customer_insights(self):
-        print("\nNow, let's discuss your customer insights.")
-        self.business_info['customer_satisfaction'] = self.ask_question("What are your current customer satisfaction metrics?")
-        self.business_info['churn_rate'] = self.ask_question("What is your customer churn rate?")
-        self.business_info['acquisition_costs'] = self.ask_question("What are your customer acquisition costs?")
-        self.business_info['customer_lifetime_value'] = self.ask_question("What is the average lifetime value of your customers?")
-
-    def sustainability(self):
-        print("\nLet's talk about sustainability and corporate social responsibility.")
-        self.business_info['sustainability_initiatives'] = self.ask_question("What are your current sustainability initiatives?")
-        self.business_info['esg_goals'] = self.ask_question("What are your ESG (Environmental, Social, Governance) goals?")
-        self.business_info['community_engagement'] = self.ask_question("How does your company engage with the community?")
-
-    def competitive_landscape(self):
-        print("\nFinally, let's discuss your competitive landscape.")
-        self.business_info['recent_competitive_changes'] = self.ask_question("What recent changes have you observed in your competitive environment?")
-        self.business_info['emerging_threats'] = self.ask_question("Are there any emerging threats or opportunities in your industry?")
-        self.business_info['industry_leaders'] = self.ask_question("How do you benchmark against industry leaders?")
-
-    def summarize_and_process(self) -> str:
-        print("\nThank you for providing that information. Let me summarize what I've gathered:")
-        
+            response = await chat.send_message_async(prompt)
+        self.history = list(chat.history)
+        return response.text
+
+    async def _summarize(self) -> InterviewStep:
         summary_prompt = f"""
         Summarize the following business information in a clear, concise manner. Highlight key points and any areas that might need further clarification:
 
@@ -141,18 +213,29 @@ class BusinessInterviewer:
 
         Provide the summary in a user-friendly format.
         """
-        
-        summary = self.chat.send_message(summary_prompt).text
-        print(summary)
-        
-        confirmation = input("\nIs this summary accurate? (yes/no): ").lower()
-        if confirmation != 'yes':
-            print("I apologize for any inaccuracies. Let's go through the information again to make corrections.")
-            return self.guided_interview()
-        
-        return self.process_query(json.dumps(self.business_info, indent=2))
-
-    def process_query(self, query: str) -> str:
+
+        summary = await self._send("interview_summary", summary_prompt)
+        self.state = "confirm"
+        return InterviewStep(
+            "confirm",
+            f"Thank you for providing that information. Let me summarize what I've gathered:\n\n{summary}",
+            "Is this summary accurate? (yes/no)"
+        )
+
+    async def _finish(self, query: str) -> InterviewStep:
+        processed_query = await self.process_query(query)
+        self.state = "done"
+        self.result = processed_query
+        preview = processed_query[:200] + "..." if len(processed_query) > 200 else processed_query
+        return InterviewStep(
+            "done",
+            "Based on our conversation, I've prepared a detailed business scenario for analysis.\n"
+            "Here's a summary of what will be used for the in-depth consultation:\n"
+            f"{preview}\n\nProceeding with the full analysis based on this information.",
+            result=processed_query
+        )
+
+    async def process_query(self, query: str) -> str:
         intro_conversation_prompt = f"""
         You are an AI business consultant tasked with analyzing the following business information or query:
 
@@ -170,13 +253,4 @@ class BusinessInterviewer:
         Your output will be used as the input for further in-depth analysis, so ensure it's thorough and well-structured.
         """
 
-        response = self.chat.send_message(intro_conversation_prompt)
-        processed_query = response.text
-
-        print("\nBased on our conversation, I've prepared a detailed business scenario for analysis.")
-        print("Here's a summary of what will be used for the in-depth consultation:")
-        print(processed_query[:200] + "..." if len(processed_query) > 200 else processed_query)
-        print("\nProceeding with the full analysis based on this information.")
-
-        return processed_query
-
+        return await self._send("process_query", intro_conversation_prompt)
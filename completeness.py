@@ -0,0 +1,165 @@
+import re
+from collections import Counter
+
+import google.generativeai as genai
+
+from prompts import COMPLETENESS_CHECK_PROMPT
+
+_WORD_TARGET_RE = re.compile(r'(?:roughly|approximately|about|around)?\s*(\d[\d,]*)(?:\s*(?:-|to)\s*\d[\d,]*)?\s+words', re.IGNORECASE)
+_FENCE_RE = re.compile(r'^\s*(```|~~~)', re.MULTILINE)
+_CONTINUATION_MARKER_RE = re.compile(
+    r'(\(continued\)|\[continued\]|to be continued|continued in the next|'
+    r'i will continue|let me continue|continuing in the next|\.\.\.)\s*$',
+    re.IGNORECASE
+)
+_TERMINAL_CHARS = '.!?:)]"\'*_`|>'
+
+# finish_reason values after which asking the model to continue is pointless or harmful
+_FINAL_FINISH_REASONS = {'SAFETY', 'RECITATION', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII'}
+# Issues that plenty of finished answers also have, so they are only hints when the model stopped on its own
+_SOFT_ISSUES = {'ends mid-sentence'}
+
+class CompletenessResult:
+    def __init__(self, complete, reason, confident=True):
+        self.complete = complete
+        self.reason = reason
+        self.confident = confident
+
+    def __repr__(self):
+        return f"CompletenessResult(complete={self.complete}, reason={self.reason!r}, confident={self.confident})"
+
+def word_target(prompt):
+    # Lower bound of the first "roughly N words" / "N-M words" request in the prompt
+    match = _WORD_TARGET_RE.search(prompt)
+    if not match:
+        return None
+    return int(match.group(1).replace(',', ''))
+
+def count_words(text):
+    return len(text.split())
+
+def finish_reason_name(finish_reason):
+    if finish_reason is None:
+        return None
+    return getattr(finish_reason, 'name', str(finish_reason)).upper()
+
+def is_final_finish_reason(reason_name):
+    return reason_name in _FINAL_FINISH_REASONS
+
+def structural_issue(response):
+    stripped = response.rstrip()
+    if not stripped:
+        return "empty response"
+    if len(_FENCE_RE.findall(stripped)) % 2:
+        return "unclosed code block"
+    last_line = stripped.rsplit('\n', 1)[-1].strip()
+    if last_line.startswith('|') and not last_line.endswith('|'):
+        return "truncated table row"
+    if _CONTINUATION_MARKER_RE.search(stripped[-80:]):
+        return "ends with a continuation marker"
+    if stripped.count('**') % 2 and stripped[-1] not in _TERMINAL_CHARS:
+        return "unclosed bold text"
+    if last_line.startswith('#'):
+        return "ends on a heading"
+    if stripped[-1] not in _TERMINAL_CHARS and not last_line.startswith(('-', '*', '+')) and not last_line[:1].isdigit():
+        return "ends mid-sentence"
+    return None
+
+class LocalCompletenessChecker:
+    name = "local"
+
+    def __init__(self, word_target_ratio=0.85):
+        self.word_target_ratio = word_target_ratio
+
+    async def check(self, prompt, response, finish_reason=None):
+        reason_name = finish_reason_name(finish_reason)
+        if reason_name == 'MAX_TOKENS':
+            return CompletenessResult(False, "finish_reason MAX_TOKENS")
+        if is_final_finish_reason(reason_name):
+            return CompletenessResult(True, f"finish_reason {reason_name}")
+
+        issue = structural_issue(response)
+        if issue:
+            return CompletenessResult(False, issue, confident=not (reason_name == 'STOP' and issue in _SOFT_ISSUES))
+
+        target = word_target(prompt)
+        if target:
+            words = count_words(response)
+            if words < target * self.word_target_ratio:
+                # The model said it stopped on its own, so a short answer is only a hint
+                return CompletenessResult(False, f"{words} of ~{target} words", confident=False)
+
+        return CompletenessResult(True, f"finish_reason {reason_name or 'unknown'}")
+
+class LLMCompletenessChecker:
+    name = "llm"
+
+    def __init__(self, model_name='gemini-1.5-flash', tail_chars=4000, provider=None, max_output_tokens=None):
+        self.model_name = model_name
+        self.tail_chars = tail_chars
+        self.provider = provider
+        self.max_output_tokens = max_output_tokens
+
+    async def check(self, prompt, response, finish_reason=None):
+        check_prompt = COMPLETENESS_CHECK_PROMPT.format(
+            prompt=prompt,
+            word_count=count_words(response),
+            response_tail=response[-self.tail_chars:]
+        )
+        model = genai.GenerativeModel(
+            self.model_name,
+            generation_config={'max_output_tokens': self.max_output_tokens} if self.max_output_tokens else None
+        )
+        if self.provider is not None:
+            verdict = await self.provider.call(lambda: model.generate_content_async(check_prompt))
+        else:
+            verdict = await model.generate_content_async(check_prompt)
+        text = verdict.text.strip().upper() if verdict.parts else ""
+        return CompletenessResult("NOT DONE" not in text, f"llm verdict {text[:20]!r}")
+
+class FallbackCompletenessChecker:
+    # Uses the primary checker and only pays for the fallback when the primary is unsure
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    async def check(self, prompt, response, finish_reason=None):
+        result = await self.primary.check(prompt, response, finish_reason)
+        if result.confident:
+            return result
+        try:
+            return await self.fallback.check(prompt, response, finish_reason)
+        except Exception:
+            return result
+
+def create_completeness_checker(mode, model_name='gemini-1.5-flash', provider=None, max_output_tokens=None):
+    if mode == "local":
+        return LocalCompletenessChecker()
+    if mode == "llm":
+        return LLMCompletenessChecker(model_name, provider=provider, max_output_tokens=max_output_tokens)
+    if mode == "local+llm":
+        return FallbackCompletenessChecker(
+            LocalCompletenessChecker(), LLMCompletenessChecker(model_name, provider=provider, max_output_tokens=max_output_tokens)
+        )
+    raise ValueError(f"Unknown completeness checker: {mode}")
+
+class ContinuationMetrics:
+    def __init__(self):
+        self.rounds_by_stage = {}
+        self.stop_reasons = Counter()
+
+    def record(self, stage, rounds, reason):
+        self.rounds_by_stage[stage] = rounds
+        self.stop_reasons[reason] += 1
+
+    def summary(self):
+        rounds = list(self.rounds_by_stage.values())
+        return {
+            'stages': len(rounds),
+            'total_rounds': sum(rounds),
+            'max_rounds': max(rounds, default=0),
+            'rounds_by_stage': dict(self.rounds_by_stage),
+            'histogram': dict(sorted(Counter(rounds).items())),
+            'stop_reasons': dict(self.stop_reasons),
+        }
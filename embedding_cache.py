@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_text(text):
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, db_path, max_memory_entries=512, max_disk_bytes=512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.seconds_saved = 0.0
+        self._miss_seconds_total = 0.0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+    def _average_miss_seconds(self):
+        return self._miss_seconds_total / self.misses if self.misses else 0.0
+
+    def _remember(self, key, vector, tokens):
+        self._memory[key] = (vector, tokens)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model, text):
+        key = cache_key(model, text)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                vector, tokens = self._memory[key]
+                self.memory_hits += 1
+                self.tokens_saved += tokens
+                self.seconds_saved += self._average_miss_seconds()
+                return vector
+
+            row = self._conn.execute(
+                "SELECT vector, tokens FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._conn.execute("UPDATE embeddings SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector, row[1])
+            self.disk_hits += 1
+            self.tokens_saved += row[1]
+            self.seconds_saved += self._average_miss_seconds()
+            return vector
+
+    def put(self, model, text, vector, tokens=0, elapsed=0.0):
+        key = cache_key(model, text)
+        vector = np.asarray(vector, dtype=np.float32)
+        blob = vector.tobytes()
+        with self._lock:
+            self.misses += 1
+            self._miss_seconds_total += elapsed
+            self._remember(key, vector, tokens)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, tokens, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, blob, tokens, len(blob), time.time())
+            )
+            self._evict()
+            self._conn.commit()
+        return vector
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+    def stats(self):
+        with self._lock:
+            entries, disk_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'tokens_saved': self.tokens_saved,
+                'seconds_saved': self.seconds_saved,
+                'memory_entries': len(self._memory),
+                'disk_entries': entries,
+                'disk_bytes': disk_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def stats_delta(before, after):
+    counters = ('memory_hits', 'disk_hits', 'misses', 'tokens_saved', 'seconds_saved')
+    delta = {name: after[name] - before[name] for name in counters}
+    lookups = delta['memory_hits'] + delta['disk_hits'] + delta['misses']
+    delta['hit_rate'] = (delta['memory_hits'] + delta['disk_hits']) / lookups if lookups else 0.0
+    return delta
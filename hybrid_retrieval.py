@@ -0,0 +1,166 @@
+import asyncio
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from local_index import METADATA_FILE
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+_LIST_ITEM_RE = re.compile(r'^\s*(?:[-*+•]|\d+[.)])\s+(.*\S)\s*$')
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or other
+our ours ourselves out over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which while who whom why will
+with would you your yours yourself yourselves
+""".split())
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    def __init__(self, ids, texts, k1=1.5, b=0.75):
+        self.ids = ids
+        self.texts = texts
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                rows, tfs = postings[term]
+                rows.append(row)
+                tfs.append(count)
+        self.average_length = float(lengths.mean()) if len(texts) else 0.0
+        self._length_norm = (1 - b + b * lengths / (self.average_length or 1.0)).astype(np.float32)
+        self._postings = {
+            term: (np.asarray(rows, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (rows, tfs) in postings.items()
+        }
+        n = len(texts)
+        self._idf = {term: math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5)) for term, (rows, _) in self._postings.items()}
+
+    @classmethod
+    def from_snapshot(cls, snapshot_dir, **kwargs):
+        ids = []
+        texts = []
+        with open(os.path.join(snapshot_dir, METADATA_FILE)) as f:
+            for line in f:
+                row = json.loads(line)
+                ids.append(row['id'])
+                texts.append((row.get('metadata') or {}).get('text', ''))
+        return cls(ids, texts, **kwargs)
+
+    def search(self, query, top_k=12):
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            rows, tfs = self._postings[term]
+            scores[rows] += self._idf[term] * tfs * (self.k1 + 1) / (tfs + self.k1 * self._length_norm[rows])
+        candidates = np.flatnonzero(scores)
+        if len(candidates) == 0:
+            return []
+        best = candidates[np.argsort(-scores[candidates])[:top_k]]
+        return [{'id': self.ids[row], 'score': float(scores[row]), 'text': self.texts[row]} for row in best]
+
+def extract_subqueries(prompt, summary, max_subqueries=4):
+    # The summary ends with a list of questions/keywords written for vector search
+    items = []
+    for line in reversed((summary or '').splitlines()):
+        match = _LIST_ITEM_RE.match(line)
+        if match:
+            items.append(match.group(1).strip('*_ '))
+        elif items and line.strip():
+            break
+    items.reverse()
+    if len(items) > max_subqueries:
+        # Group the list into max_subqueries roughly equal sub-queries
+        size = math.ceil(len(items) / max_subqueries)
+        items = ['; '.join(items[start:start + size]) for start in range(0, len(items), size)]
+    return [item for item in items if item][:max_subqueries]
+
+def reciprocal_rank_fusion(result_lists, k=60):
+    fused = {}
+    for results in result_lists:
+        for rank, match in enumerate(results):
+            entry = fused.setdefault(match['id'], {'id': match['id'], 'text': match['text'], 'score': 0.0})
+            entry['score'] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda match: match['score'], reverse=True)
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def mmr_select(matches, top_k, diversity=0.3, duplicate_threshold=0.8):
+    # Maximal marginal relevance over token-set similarity; near-duplicates are dropped outright
+    if not matches:
+        return []
+    max_score = max(match['score'] for match in matches) or 1.0
+    token_sets = [set(tokenize(match['text'])) for match in matches]
+    selected = []
+    candidates = list(range(len(matches)))
+    while candidates and len(selected) < top_k:
+        best, best_value = None, None
+        for candidate in list(candidates):
+            similarity = max((_jaccard(token_sets[candidate], token_sets[chosen]) for chosen in selected), default=0.0)
+            if similarity >= duplicate_threshold:
+                candidates.remove(candidate)
+                continue
+            value = (1 - diversity) * matches[candidate]['score'] / max_score - diversity * similarity
+            if best_value is None or value > best_value:
+                best, best_value = candidate, value
+        if best is None:
+            break
+        selected.append(best)
+        candidates.remove(best)
+    return [matches[index] for index in selected]
+
+class HybridRetriever:
+    def __init__(self, load_lexical_index, embed_texts, dense_query, run_blocking, top_k=12,
+                 candidates_per_query=24, max_subqueries=4, rrf_k=60, mmr_diversity=0.3, duplicate_threshold=0.8):
+        self.load_lexical_index = load_lexical_index
+        self.embed_texts = embed_texts
+        self.dense_query = dense_query
+        self.run_blocking = run_blocking
+        self.top_k = top_k
+        self.candidates_per_query = candidates_per_query
+        self.max_subqueries = max_subqueries
+        self.rrf_k = rrf_k
+        self.mmr_diversity = mmr_diversity
+        self.duplicate_threshold = duplicate_threshold
+        self._lexical_index = None
+        self._lexical_lock = None
+
+    async def lexical_index(self):
+        # Built lazily on first use because tokenizing the corpus takes a while
+        if self._lexical_lock is None:
+            self._lexical_lock = asyncio.Lock()
+        async with self._lexical_lock:
+            if self._lexical_index is None:
+                self._lexical_index = await self.run_blocking(self.load_lexical_index)
+            return self._lexical_index
+
+    async def search(self, query_text, query_embedding, subqueries=()):
+        lexical_index = await self.lexical_index()
+        subqueries = list(subqueries)
+        subquery_embeddings = await self.embed_texts(subqueries) if subqueries else []
+
+        searches = [self.dense_query(query_embedding, self.candidates_per_query)]
+        searches += [self.dense_query(embedding, self.candidates_per_query) for embedding in subquery_embeddings]
+        searches += [
+            self.run_blocking(lexical_index.search, text, self.candidates_per_query)
+            for text in [query_text] + subqueries
+        ]
+        result_lists = await asyncio.gather(*searches)
+
+        fused = reciprocal_rank_fusion(result_lists, self.rrf_k)
+        return mmr_select(fused, self.top_k, self.mmr_diversity, self.duplicate_threshold)
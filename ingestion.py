@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.md', '.markdown', '.txt')
+
+class Chunk:
+    def __init__(self, source, position, text):
+        self.source = source
+        self.position = position
+        self.text = text
+        # Content-addressed, so identical passages share one vector across documents
+        self.id = hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+    def metadata(self):
+        return {'text': self.text, 'source': self.source, 'chunk': self.position}
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+            yield path
+
+def read_document(path):
+    if path.lower().endswith('.pdf'):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("PDF ingestion requires the 'pypdf' package")
+        return '\n\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def chunk_text(text, chunk_words=400, overlap_words=60):
+    words = text.split()
+    step = max(1, chunk_words - overlap_words)
+    for start in range(0, len(words), step):
+        yield ' '.join(words[start:start + chunk_words])
+        if start + chunk_words >= len(words):
+            break
+
+def iter_chunks(path, chunk_words=400, overlap_words=60):
+    for position, text in enumerate(chunk_text(read_document(path), chunk_words, overlap_words)):
+        yield Chunk(path, position, text)
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class IngestionManifest:
+    # Checkpoint of which file version produced which chunk ids; saved after every
+    # fully upserted document so an interrupted run resumes where it stopped.
+    def __init__(self, path):
+        self.path = path
+        self.documents = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.documents = json.load(f).get('documents', {})
+
+    def is_current(self, source, source_hash):
+        entry = self.documents.get(source)
+        return entry is not None and entry['hash'] == source_hash
+
+    def known_chunks(self):
+        return {chunk_id for entry in self.documents.values() for chunk_id in entry['chunks']}
+
+    def commit(self, source, source_hash, chunk_ids):
+        previous = set(self.documents.get(source, {}).get('chunks', []))
+        self.documents[source] = {'hash': source_hash, 'chunks': chunk_ids}
+        still_referenced = self.known_chunks()
+        self.save()
+        return sorted(previous - still_referenced)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'documents': self.documents}, f)
+        os.replace(tmp_path, self.path)
+
+class IngestionStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.documents = 0
+        self.documents_skipped = 0
+        self.chunks = 0
+        self.chunks_embedded = 0
+        self.chunks_deduplicated = 0
+        self.chunks_deleted = 0
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.documents} docs ingested ({self.documents_skipped} unchanged), "
+            f"{self.chunks} chunks ({self.chunks_embedded} embedded, {self.chunks_deduplicated} deduplicated, "
+            f"{self.chunks_deleted} deleted) in {elapsed:.1f}s: "
+            f"{self.documents / elapsed:.2f} docs/sec, {self.chunks / elapsed:.1f} chunks/sec"
+        )
+
+def ingest(paths, embed_batch, upsert_batch, manifest, delete_ids=None, chunk_words=400,
+           overlap_words=60, batch_size=64, workers=4):
+    # embed_batch(texts) -> vectors; upsert_batch([(id, values, metadata)]); delete_ids([id])
+    stats = IngestionStats()
+    known = manifest.known_chunks()
+    # chunk id -> documents waiting for that chunk's upsert to finish
+    waiters = {}
+    pending_documents = {}
+    remaining = {}
+
+    def process(batch):
+        vectors = embed_batch([chunk.text for chunk in batch])
+        upsert_batch([(chunk.id, list(map(float, vector)), chunk.metadata()) for chunk, vector in zip(batch, vectors)])
+        return batch
+
+    def finish_document(source):
+        source_hash, chunk_ids = pending_documents.pop(source)
+        stale = manifest.commit(source, source_hash, chunk_ids)
+        if stale and delete_ids is not None:
+            delete_ids(stale)
+            stats.chunks_deleted += len(stale)
+        stats.documents += 1
+
+    def collect(futures, block):
+        done, _ = wait(futures, return_when=FIRST_COMPLETED) if block else (
+            {future for future in futures if future.done()}, None)
+        for future in done:
+            futures.remove(future)
+            batch = future.result()
+            stats.chunks_embedded += len(batch)
+            for chunk in batch:
+                known.add(chunk.id)
+                for source in waiters.pop(chunk.id):
+                    remaining[source] -= 1
+                    if remaining[source] == 0:
+                        finish_document(source)
+
+    def new_chunks():
+        for source in iter_paths(paths):
+            source_hash = file_hash(source)
+            if manifest.is_current(source, source_hash):
+                stats.documents_skipped += 1
+                continue
+            chunk_ids = []
+            # Held at 1 until the document is fully chunked so it cannot complete early
+            remaining[source] = 1
+            pending_documents[source] = (source_hash, chunk_ids)
+            for chunk in iter_chunks(source, chunk_words, overlap_words):
+                stats.chunks += 1
+                chunk_ids.append(chunk.id)
+                if chunk.id in known:
+                    stats.chunks_deduplicated += 1
+                    continue
+                if chunk.id in waiters:
+                    # Already queued by this run; the document completes once that upsert lands
+                    if source not in waiters[chunk.id]:
+                        waiters[chunk.id].append(source)
+                        remaining[source] += 1
+                    stats.chunks_deduplicated += 1
+                    continue
+                waiters[chunk.id] = [source]
+                remaining[source] += 1
+                yield chunk
+            remaining[source] -= 1
+            if remaining[source] == 0:
+                finish_document(source)
+
+    futures = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as executor:
+        for batch in batched(new_chunks(), batch_size):
+            # Keep a bounded number of batches in flight so memory stays flat
+            while len(futures) >= workers * 2:
+                collect(futures, block=True)
+            futures.add(executor.submit(process, batch))
+            collect(futures, block=False)
+            logging.info(f"Ingestion progress: {stats.report()}")
+        while futures:
+            collect(futures, block=True)
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest PDF/markdown/text documents into the business corpus index")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--openai-api-key", required=True)
+    parser.add_argument("--pinecone-api-key", required=True)
+    parser.add_argument("--index", default="corpus-anything-llm-2")
+    parser.add_argument("--namespace", default="pinecone")
+    parser.add_argument("--model", default="text-embedding-3-large")
+    parser.add_argument("--manifest", default=os.path.expanduser("~/.cache/ceo-pro/ingestion_manifest.json"))
+    parser.add_argument("--embedding-cache", default=os.path.expanduser("~/.cache/ceo-pro/embeddings.sqlite3"))
+    parser.add_argument("--chunk-words", type=int, default=400)
+    parser.add_argument("--overlap-words", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from openai import OpenAI
+    from pinecone import Pinecone
+    from embedding_cache import EmbeddingCache
+
+    openai_client = OpenAI(api_key=args.openai_api_key)
+    index = Pinecone(api_key=args.pinecone_api_key).Index(args.index)
+    cache = EmbeddingCache(args.embedding_cache)
+    os.makedirs(os.path.dirname(args.manifest) or '.', exist_ok=True)
+
+    def embed_batch(texts):
+        vectors = [cache.get(args.model, text) for text in texts]
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        if missing:
+            start = time.perf_counter()
+            response = openai_client.embeddings.create(input=missing, model=args.model)
+            elapsed = time.perf_counter() - start
+            fetched = {missing[item.index]: cache.put(args.model, missing[item.index], item.embedding, 0, elapsed / len(missing))
+                       for item in response.data}
+            vectors = [vector if vector is not None else fetched[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    stats = ingest(
+        args.paths,
+        embed_batch,
+        lambda vectors: index.upsert(vectors=vectors, namespace=args.namespace),
+        IngestionManifest(args.manifest),
+        delete_ids=lambda ids: index.delete(ids=ids, namespace=args.namespace),
+        chunk_words=args.chunk_words,
+        overlap_words=args.overlap_words,
+        batch_size=args.batch_size,
+        workers=args.workers,
+    )
+    logging.info(f"Ingestion finished: {stats.report()}")
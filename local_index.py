@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# Snapshot layout (one namespace per directory):
+#   manifest.json     {"dimension", "count", "namespace", "normalized"}
+#   vectors.f32       count x dimension float32 rows, L2-normalized
+#   metadata.jsonl    one {"id", "metadata"} object per row, in row order
+#   ivf.npz           optional centroids/assignments written by build_ivf()
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.jsonl"
+IVF_FILE = "ivf.npz"
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class SnapshotWriter:
+    # Streams vectors to disk so exports never hold the whole corpus in memory
+    def __init__(self, snapshot_dir, dimension, namespace=""):
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self.snapshot_dir = snapshot_dir
+        self.dimension = dimension
+        self.namespace = namespace
+        self.count = 0
+        self._vectors = open(os.path.join(snapshot_dir, VECTORS_FILE), 'wb')
+        self._metadata = open(os.path.join(snapshot_dir, METADATA_FILE), 'w')
+
+    def write(self, ids, vectors, metadatas):
+        vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension))
+        self._vectors.write(vectors.astype(np.float32).tobytes())
+        for vector_id, metadata in zip(ids, metadatas):
+            self._metadata.write(json.dumps({'id': vector_id, 'metadata': metadata or {}}) + "\n")
+        self.count += len(vectors)
+
+    def close(self):
+        self._vectors.close()
+        self._metadata.close()
+        with open(os.path.join(self.snapshot_dir, MANIFEST_FILE), 'w') as f:
+            json.dump({
+                'dimension': self.dimension,
+                'count': self.count,
+                'namespace': self.namespace,
+                'normalized': True,
+            }, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_snapshot(snapshot_dir, ids, vectors, metadatas, namespace=""):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    with SnapshotWriter(snapshot_dir, vectors.shape[1], namespace) as writer:
+        writer.write(ids, vectors, metadatas)
+
+def export_pinecone_snapshot(index, namespace, snapshot_dir, dimension, batch_size=100):
+    # Serverless indexes support list(); each page of ids is fetched with its values
+    with SnapshotWriter(snapshot_dir, dimension, namespace) as writer:
+        for id_batch in index.list(namespace=namespace, limit=batch_size):
+            fetched = index.fetch(ids=list(id_batch), namespace=namespace)['vectors']
+            ids = [vector_id for vector_id in id_batch if vector_id in fetched]
+            writer.write(
+                ids,
+                [fetched[vector_id]['values'] for vector_id in ids],
+                [fetched[vector_id].get('metadata') for vector_id in ids]
+            )
+    return writer.count
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+class LocalVectorIndex:
+    # Drop-in for the subset of pinecone.Index that retrieval uses: describe_index_stats() and query()
+    def __init__(self, snapshot_dir, mode="exact", nprobe=8):
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.snapshot_dir = snapshot_dir
+        self.dimension = self.manifest['dimension']
+        self.count = self.manifest['count']
+        self.namespace = self.manifest.get('namespace', "")
+        self.mode = mode
+        self.nprobe = nprobe
+        if self.count:
+            self.vectors = np.memmap(os.path.join(snapshot_dir, VECTORS_FILE), dtype=np.float32, mode='r',
+                                     shape=(self.count, self.dimension))
+        else:
+            self.vectors = np.empty((0, self.dimension), dtype=np.float32)
+        with open(os.path.join(snapshot_dir, METADATA_FILE)) as f:
+            rows = [json.loads(line) for line in f]
+        self.ids = [row['id'] for row in rows]
+        self.metadata = [row['metadata'] for row in rows]
+
+        self.centroids = None
+        self._lists = None
+        if mode == "ivf":
+            self.load_ivf()
+        elif mode != "exact":
+            raise ValueError(f"Unknown local index mode: {mode}")
+
+    def describe_index_stats(self):
+        return {
+            'dimension': self.dimension,
+            'total_vector_count': self.count,
+            'namespaces': {self.namespace: {'vector_count': self.count}},
+        }
+
+    def _prepare_query(self, vector):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def search_exact(self, query, top_k):
+        scores = self.vectors @ query
+        rows = _top_k(scores, top_k)
+        return rows, scores[rows]
+
+    def search_ivf(self, query, top_k, nprobe=None):
+        probes = _top_k(self.centroids @ query, nprobe or self.nprobe)
+        candidates = np.concatenate([self._lists[probe] for probe in probes])
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        candidates.sort()
+        scores = self.vectors[candidates] @ query
+        best = _top_k(scores, top_k)
+        return candidates[best], scores[best]
+
+    def search(self, vector, top_k):
+        query = self._prepare_query(vector)
+        if self.mode == "ivf":
+            return self.search_ivf(query, top_k)
+        return self.search_exact(query, top_k)
+
+    def query(self, vector, top_k=10, namespace=None, include_values=False, include_metadata=False, **kwargs):
+        # A snapshot holds exactly one namespace, so the namespace argument is informational
+        if self.count == 0:
+            return {'matches': [], 'namespace': namespace}
+        rows, scores = self.search(vector, top_k)
+        matches = []
+        for row, score in zip(rows, scores):
+            match = {'id': self.ids[row], 'score': float(score)}
+            match['metadata'] = self.metadata[row] if include_metadata else None
+            if include_values:
+                match['values'] = self.vectors[row].tolist()
+            matches.append(match)
+        return {'matches': matches, 'namespace': namespace}
+
+    def build_ivf(self, n_lists=None, iterations=10, sample_size=50000, seed=0):
+        # Spherical k-means over a sample, then every row is assigned to its nearest centroid
+        rng = np.random.default_rng(seed)
+        n_lists = n_lists or max(1, int(np.sqrt(self.count)))
+        sample_rows = np.sort(rng.choice(self.count, min(sample_size, self.count), replace=False))
+        sample = np.asarray(self.vectors[sample_rows])
+        centroids = sample[rng.choice(len(sample), min(n_lists, len(sample)), replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind='stable')
+            occupied, starts = np.unique(assignment[order], return_index=True)
+            # Empty lists keep their previous centroid
+            centroids[occupied] = np.add.reduceat(sample[order], starts, axis=0)
+            centroids = _normalize_rows(centroids)
+
+        assignments = np.empty(self.count, dtype=np.int32)
+        for start in range(0, self.count, 65536):
+            block = np.asarray(self.vectors[start:start + 65536])
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        np.savez(os.path.join(self.snapshot_dir, IVF_FILE), centroids=centroids.astype(np.float32), assignments=assignments)
+        self._set_ivf(centroids.astype(np.float32), assignments)
+
+    def load_ivf(self):
+        path = os.path.join(self.snapshot_dir, IVF_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No IVF index in {self.snapshot_dir}; run build_ivf() first")
+        data = np.load(path)
+        self._set_ivf(data['centroids'], data['assignments'])
+
+    def _set_ivf(self, centroids, assignments):
+        self.centroids = centroids
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self._lists = [order[boundaries[i]:boundaries[i + 1]] for i in range(len(centroids))]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage local vector index snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export a Pinecone namespace to a snapshot")
+    export_parser.add_argument("snapshot_dir")
+    export_parser.add_argument("--api-key", required=True)
+    export_parser.add_argument("--index", default="corpus-anything-llm-2")
+    export_parser.add_argument("--namespace", default="pinecone")
+    export_parser.add_argument("--dimension", type=int, default=3072)
+
+    ivf_parser = subparsers.add_parser("build-ivf", help="Build the approximate IVF index for a snapshot")
+    ivf_parser.add_argument("snapshot_dir")
+    ivf_parser.add_argument("--lists", type=int, default=None)
+    ivf_parser.add_argument("--iterations", type=int, default=10)
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    if args.command == "export":
+        from pinecone import Pinecone
+        pinecone_index = Pinecone(api_key=args.api_key).Index(args.index)
+        count = export_pinecone_snapshot(pinecone_index, args.namespace, args.snapshot_dir, args.dimension)
+        print(f"Exported {count} vectors to {args.snapshot_dir} in {time.perf_counter() - start:.1f}s")
+    else:
+        local_index = LocalVectorIndex(args.snapshot_dir)
+        local_index.build_ivf(args.lists, args.iterations)
+        print(f"Built IVF index with {len(local_index.centroids)} lists in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,122 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+_FLUSH = object()
+_STOP = object()
+
+class BufferedLogWriter:
+    # Appends log text from a dedicated thread so callers on the event loop only
+    # enqueue. Queued writes are grouped per file and written in batches; files
+    # written with rotate=True roll over to .1, .2, ... once they pass max_bytes.
+    def __init__(self, flush_interval=0.25, max_batch=512, max_bytes=20 * 1024 * 1024, backup_count=3):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batches_written = 0
+        self.records_written = 0
+        self.rotations = 0
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._sizes = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+
+    def write(self, path, text, rotate=True):
+        self._ensure_started()
+        self._queue.put((path, text, rotate))
+
+    def write_json(self, path, record, rotate=True):
+        self.write(path, json.dumps(record, ensure_ascii=False, default=str) + "\n", rotate)
+
+    def flush(self, timeout=5.0):
+        # Blocks until everything queued before the call is on disk
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put((_FLUSH, done, None))
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self._queue.put((_STOP, None, None))
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Gather a batch: whatever arrives within flush_interval, up to max_batch
+            while len(items) < self.max_batch and items[-1][0] not in (_FLUSH, _STOP):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            pending = OrderedDict()
+            for path, text, rotate in items:
+                if path is _FLUSH or path is _STOP:
+                    continue
+                texts, rotating = pending.get(path, ([], rotate))
+                texts.append(text)
+                pending[path] = (texts, rotating and rotate)
+            for path, (texts, rotate) in pending.items():
+                self._append(path, ''.join(texts), rotate)
+                self.records_written += len(texts)
+            self.batches_written += 1
+            marker, payload, _ = items[-1]
+            if marker is _FLUSH:
+                payload.set()
+            elif marker is _STOP:
+                return
+
+    def _append(self, path, text, rotate):
+        data = text.encode('utf-8')
+        try:
+            if rotate:
+                size = self._sizes.get(path)
+                if size is None:
+                    size = os.path.getsize(path) if os.path.exists(path) else 0
+                if size and size + len(data) > self.max_bytes:
+                    self._rotate(path)
+                    size = 0
+                self._sizes[path] = size + len(data)
+            with open(path, 'ab') as f:
+                f.write(data)
+        except OSError:
+            self.errors += 1
+
+    def _rotate(self, path):
+        for number in range(self.backup_count - 1, 0, -1):
+            source = f"{path}.{number}"
+            if os.path.exists(source):
+                os.replace(source, f"{path}.{number + 1}")
+        if self.backup_count > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+        self.rotations += 1
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'batches_written': self.batches_written,
+            'records_written': self.records_written,
+            'rotations': self.rotations,
+            'errors': self.errors,
+        }
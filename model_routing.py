@@ -0,0 +1,67 @@
+from collections import Counter
+
+from tracing import registry
+
+class Route:
+    def __init__(self, task, tier, model, max_output_tokens=None, downgraded=False):
+        self.task = task
+        self.tier = tier
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.downgraded = downgraded
+
+    @property
+    def generation_config(self):
+        return {'max_output_tokens': self.max_output_tokens} if self.max_output_tokens else None
+
+    def __repr__(self):
+        return f"Route({self.task!r} -> {self.model!r}, max_output_tokens={self.max_output_tokens}{', downgraded' if self.downgraded else ''})"
+
+class ModelRouter:
+    # Picks the model for each task (a pipeline stage, an interviewer step, summaries,
+    # completeness checks) from a routing table of tiers. tiers is ordered from the
+    # strongest model to the cheapest; a route marked 'downgrade' moves one tier down
+    # while pressure() is at or above downgrade_pressure.
+    def __init__(self, tiers, routes, default_route, pressure=None, downgrade_pressure=None):
+        self.tiers = dict(tiers)
+        self.tier_order = list(self.tiers)
+        for task, settings in list(routes.items()) + [("default", default_route)]:
+            if settings['tier'] not in self.tiers:
+                raise ValueError(f"Route {task} uses unknown tier {settings['tier']!r}")
+        self.routes = dict(routes)
+        self.default_route = default_route
+        self.pressure = pressure
+        self.downgrade_pressure = downgrade_pressure
+        self.counts = Counter()
+        self.downgrades = 0
+
+    def cheaper_tier(self, tier):
+        position = self.tier_order.index(tier)
+        return self.tier_order[position + 1] if position + 1 < len(self.tier_order) else None
+
+    def under_pressure(self):
+        if self.pressure is None or self.downgrade_pressure is None:
+            return False
+        return self.pressure() >= self.downgrade_pressure
+
+    def route(self, task):
+        settings = self.routes.get(task, self.default_route)
+        tier = settings['tier']
+        downgraded = False
+        if settings.get('downgrade') and self.under_pressure():
+            cheaper = self.cheaper_tier(tier)
+            if cheaper is not None:
+                tier, downgraded = cheaper, True
+        route = Route(task, tier, self.tiers[tier], settings.get('max_output_tokens'), downgraded)
+        self.counts[(task, route.model)] += 1
+        if downgraded:
+            self.downgrades += 1
+            registry.increment('ceo_pro_model_downgrades_total', {'task': task})
+        registry.increment('ceo_pro_model_routes_total', {'task': task, 'model': route.model})
+        return route
+
+    def stats(self):
+        return {
+            'routes': {f"{task} -> {model}": count for (task, model), count in sorted(self.counts.items())},
+            'downgrades': self.downgrades,
+        }
@@ -1,86 +1,111 @@
 import markdown2
-from weasyprint import HTML
+from weasyprint import CSS, HTML
 import re
 
+# Bump when the markdown preprocessing or HTML template changes, so cached PDFs are re-rendered
+RENDERER_VERSION = 1
+
+STYLESHEET = '''
+body {
+    font-family: Arial, sans-serif;
+    font-size: 12px;
+}
+h1 {
+    font-size: 24px;
+    font-weight: bold;
+    page-break-before: always;
+}
+h2, h3, h4, h5, h6 {
+    font-size: 14px;
+}
+table {
+    width: 100%;
+    border-collapse: collapse;
+    font-size: 9px;
+}
+th, td {
+    border: 1px solid black;
+    padding: 5px;
+    text-align: left;
+}
+th {
+    background-color: #f2f2f2;
+}
+.page-break {
+    page-break-before: always;
+}
+'''
+
+HTML_HEAD = '''
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Final Report</title>
+</head>
+<body>
+'''
+
+HTML_TAIL = '''
+</body>
+</html>
+'''
+
+# One pass over the whole document: strips "Assistant:" prefixes and turns "### "
+# lines (after the prefix is removed) into page-broken top-level headings.
+# [^\S\n] keeps the whitespace match on the current line.
+_LINE_RE = re.compile(r'^(?:Assistant:[^\S\n]*(?:### (.*))?|### (.*))', re.M)
+
+def _replace_line(match):
+    title = match.group(1) if match.group(1) is not None else match.group(2)
+    if title is None:
+        return ''
+    return f'<div class="page-break"></div>\n# {title.strip()}'
+
+class PdfRenderer:
+    # Long-lived so the stylesheet is parsed once and the markdown converter is
+    # reused for every document rendered by this process.
+    SUPPORTED_EXTENSIONS = ('.md', '.txt', '.log')
+
+    def __init__(self, stylesheet=STYLESHEET):
+        self.css = CSS(string=stylesheet)
+        self.markdown = markdown2.Markdown(extras=["tables"])
+
+    def preprocess(self, content):
+        return _LINE_RE.sub(_replace_line, content)
+
+    def to_html(self, content):
+        return HTML_HEAD + self.markdown.convert(self.preprocess(content)) + HTML_TAIL
+
+    def render(self, content, pdf_file_path):
+        HTML(string=self.to_html(content)).write_pdf(pdf_file_path, stylesheets=[self.css])
+
+    def convert_file(self, file_path):
+        # Convert content based on file type
+        if not file_path.endswith(self.SUPPORTED_EXTENSIONS):
+            raise ValueError("Unsupported file type. Please provide a '.md', '.txt', or '.log' file.")
+        with open(file_path, 'r') as file:
+            content = file.read()
+        pdf_file_path = file_path.rsplit('.', 1)[0] + '.pdf'
+        self.render(content, pdf_file_path)
+        return pdf_file_path
+
+_renderer = None
+
+def default_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = PdfRenderer()
+    return _renderer
+
 def convert_to_pdf(file_path):
-    html_template = '''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <title>Final Report</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                font-size: 12px;
-            }}
-            h1 {{
-                font-size: 24px;
-                font-weight: bold;
-                page-break-before: always;
-            }}
-            h2, h3, h4, h5, h6 {{
-                font-size: 14px;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-                font-size: 9px;
-            }}
-            th, td {{
-                border: 1px solid black;
-                padding: 5px;
-                text-align: left;
-            }}
-            th {{
-                background-color: #f2f2f2;
-            }}
-            .page-break {{
-                page-break-before: always;
-            }}
-        </style>
-    </head>
-    <body>
-        {content}
-    </body>
-    </html>
-    '''
-
-    with open(file_path, 'r') as file:
-        content = file.read()
-
-    # Convert content based on file type
-    if file_path.endswith(('.md', '.txt', '.log')):
-        # Pre-process the content to handle page breaks and titles
-        content = preprocess_content(content)
-        html_content = markdown2.markdown(content, extras=["tables"])
-    else:
-        raise ValueError("Unsupported file type. Please provide a '.md', '.txt', or '.log' file.")
-
-    html_full = html_template.format(content=html_content)
-    pdf_file_path = file_path.rsplit('.', 1)[0] + '.pdf'
-    HTML(string=html_full).write_pdf(pdf_file_path)
+    pdf_file_path = default_renderer().convert_file(file_path)
     print(f"PDF generated at: {pdf_file_path}")
+    return pdf_file_path
 
 def preprocess_content(content):
-    # Split content into lines
-    lines = content.split('\n')
-    processed_lines = []
-    
-    for line in lines:
-        # Remove "Assistant:" prefix
-        line = re.sub(r'^Assistant:\s*', '', line)
-        
-        # Handle page breaks and titles
-        if line.startswith('### '):
-            title = line[4:].strip()
-            processed_lines.append('<div class="page-break"></div>')
-            processed_lines.append(f'# {title}')
-        else:
-            processed_lines.append(line)
-    
-    return '\n'.join(processed_lines)
+    return default_renderer().preprocess(content)
 
 if __name__ == "__main__":
     file_path = input("Enter the path to the Markdown, Text, or Log file: ")
-    convert_to_pdf(file_path)
\ No newline at end of file
+    convert_to_pdf(file_path)
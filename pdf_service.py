@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_conversion import HTML_HEAD, HTML_TAIL, RENDERER_VERSION, STYLESHEET, convert_to_pdf
+
+# Mixed into every cache key, so PDFs rendered with another stylesheet or renderer are not reused
+RENDER_FINGERPRINT = hashlib.sha256(f"{RENDERER_VERSION}\n{STYLESHEET}\n{HTML_HEAD}\n{HTML_TAIL}".encode()).hexdigest()
+
+def pdf_path_for(file_path):
+    return file_path.rsplit('.', 1)[0] + '.pdf'
+
+def _content_hash(file_path):
+    digest = hashlib.sha256(RENDER_FINGERPRINT.encode())
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class PdfRenderService:
+    # Renders markdown documents to PDF in a process pool, off the event loop and in
+    # parallel. Rendered PDFs are kept by a hash of the source and the renderer settings,
+    # so an unchanged document is copied from the cache instead of being rendered again.
+    def __init__(self, cache_dir, max_workers=3, max_cached=256, run_blocking=None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_cached = max_cached
+        self.run_blocking = run_blocking
+        self.rendered = 0
+        self.cache_hits = 0
+        self._pool = None
+        self._in_flight = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def _io(self, func, *args):
+        if self.run_blocking is not None:
+            return await self.run_blocking(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def render(self, file_path):
+        return asyncio.ensure_future(self._render(file_path))
+
+    async def _render(self, file_path):
+        content_hash = await self._io(_content_hash, file_path)
+        cached_path = os.path.join(self.cache_dir, f"{content_hash}.pdf")
+        pdf_path = pdf_path_for(file_path)
+        if not os.path.exists(cached_path):
+            # Concurrent requests for the same content share one render
+            render = self._in_flight.get(content_hash)
+            if render is None:
+                render = asyncio.ensure_future(self._render_to_cache(file_path, pdf_path, cached_path))
+                self._in_flight[content_hash] = render
+                render.add_done_callback(lambda _: self._in_flight.pop(content_hash, None))
+                await asyncio.shield(render)
+                return pdf_path
+            await asyncio.shield(render)
+        self.cache_hits += 1
+        await self._io(shutil.copyfile, cached_path, pdf_path)
+        return pdf_path
+
+    async def _render_to_cache(self, file_path, pdf_path, cached_path):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor(), convert_to_pdf, file_path)
+        self.rendered += 1
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+        await self._io(shutil.copyfile, pdf_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+        await self._io(self._prune)
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.pdf')]
+        if len(entries) <= self.max_cached:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_cached]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {'rendered': self.rendered, 'cache_hits': self.cache_hits, 'in_flight': len(self._in_flight)}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from prompts import (
+    CONTINUE_CRITIQUE_PROMPT, CRITIQUE_PROMPT, IMPLEMENTATION_PROMPT, PROMPT_1, PROMPT_2, PROMPT_3, PROMPT_4, PROMPT_5,
+    REWRITE_PROMPT
+)
+from session import current_stage
+from tracing import span
+
+class Stage:
+    def __init__(self, name, prompt, retrieval_prompt, depends_on=(), updates_summary=True, report_file=None, template=None):
+        self.name = name
+        self.prompt = prompt
+        # The unformatted prompt template, used to key cached outputs
+        self.template = template or prompt
+        self.retrieval_prompt = retrieval_prompt
+        self.depends_on = tuple(depends_on)
+        self.updates_summary = updates_summary
+        self.report_file = report_file
+
+class StageResult:
+    def __init__(self, name, response, turns, vector_info="", summary=""):
+        self.name = name
+        self.response = response
+        # The stage's own chat turns, replayed into the history of dependent stages
+        self.turns = turns
+        self.vector_info = vector_info
+        self.summary = summary
+        self.timings = {}
+
+def consultation_stages(user_input, parallel=True):
+    # With parallel=False every stage depends on the previous one, which reproduces
+    # the original single-chat ordering.
+    critiques = ("CRITIQUE_PROMPT", "CONTINUE_CRITIQUE_PROMPT")
+    stages = [
+        Stage("PROMPT_1", PROMPT_1.format(user_query=user_input), user_input, template=PROMPT_1),
+        Stage("PROMPT_2", PROMPT_2, PROMPT_1, ["PROMPT_1"]),
+        Stage("PROMPT_3", PROMPT_3, PROMPT_2, ["PROMPT_2"]),
+        Stage("PROMPT_4", PROMPT_4, PROMPT_3, ["PROMPT_3"]),
+        Stage("PROMPT_5", PROMPT_5, PROMPT_4, ["PROMPT_4"]),
+        Stage("CRITIQUE_PROMPT", CRITIQUE_PROMPT, CRITIQUE_PROMPT, ["PROMPT_5"]),
+        # Continues the critique session, so it needs the first critique in its chat
+        Stage("CONTINUE_CRITIQUE_PROMPT", CONTINUE_CRITIQUE_PROMPT, CONTINUE_CRITIQUE_PROMPT, ["CRITIQUE_PROMPT"]),
+        Stage("REWRITE_PROMPT", REWRITE_PROMPT, REWRITE_PROMPT, critiques, False, "Final_Business_Report.md"),
+        Stage("IMPLEMENTATION_PROMPT", IMPLEMENTATION_PROMPT, IMPLEMENTATION_PROMPT, critiques, False, "Final_Implementation_Plan.md"),
+    ]
+    if not parallel:
+        for previous, stage in zip(stages, stages[1:]):
+            stage.depends_on = (previous.name,)
+    return stages
+
+def validate_stages(stages):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Stage names must be unique")
+    seen = set()
+    for stage in stages:
+        missing = [dependency for dependency in stage.depends_on if dependency not in seen]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on {missing}, which are not listed before it")
+        seen.add(stage.name)
+
+def ancestors(stages, name):
+    by_name = {stage.name: stage for stage in stages}
+    found = set()
+    pending = list(by_name[name].depends_on)
+    while pending:
+        dependency = pending.pop()
+        if dependency not in found:
+            found.add(dependency)
+            pending.extend(by_name[dependency].depends_on)
+    return found
+
+def dependents(stages, name):
+    return [stage for stage in stages if name in stage.depends_on]
+
+def history_for(stages, name, results):
+    # Ancestors' turns in declaration order, which is a topological order
+    upstream = ancestors(stages, name)
+    return [turn for stage in stages if stage.name in upstream for turn in results[stage.name].turns]
+
+class PipelineExecutor:
+    def __init__(self, run_stage, semaphore, on_stage_start=None):
+        # run_stage(stage, results) -> StageResult; semaphore caps concurrent stages across all runs
+        self.run_stage = run_stage
+        self.semaphore = semaphore
+        self.on_stage_start = on_stage_start
+
+    async def run(self, stages, results=None):
+        validate_stages(stages)
+        results = dict(results or {})
+        done = {stage.name: asyncio.Event() for stage in stages}
+        for name in results:
+            if name in done:
+                done[name].set()
+
+        async def execute(stage):
+            for dependency in stage.depends_on:
+                await done[dependency].wait()
+            current_stage.set(stage.name)
+            ready_at = time.perf_counter()
+            async with self.semaphore:
+                started_at = time.perf_counter()
+                if self.on_stage_start is not None:
+                    self.on_stage_start(stage, results)
+                with span("stage", stage=stage.name, queued=started_at - ready_at):
+                    result = await self.run_stage(stage, results)
+            result.timings['queued'] = started_at - ready_at
+            result.timings['total'] = time.perf_counter() - started_at
+            result.timings['finished_at'] = time.perf_counter()
+            results[stage.name] = result
+            done[stage.name].set()
+
+        tasks = [asyncio.ensure_future(execute(stage)) for stage in stages if stage.name not in results]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return results
+
+def format_timings(stages, results, started_at):
+    lines = []
+    for stage in stages:
+        result = results.get(stage.name)
+        if result is None or 'total' not in result.timings:
+            continue
+        timings = result.timings
+        details = ', '.join(f"{key} {value:.2f}s" for key, value in timings.items() if key not in ('total', 'finished_at'))
+        lines.append(
+            f"{stage.name}: {timings['total']:.2f}s, done at +{timings['finished_at'] - started_at:.2f}s ({details})"
+        )
+    return '\n'.join(lines)
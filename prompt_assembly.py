@@ -0,0 +1,136 @@
+import re
+
+_TOKEN_PIECE_RE = re.compile(r"\w{1,6}|[^\w\s]")
+_PASSAGE_RE = re.compile(r"Score: [-+0-9.e]+, Text: ")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+TRUNCATION_MARKER = "[...]"
+_DATABASE_RE = re.compile(r"<database>\n.*?\n</database>", re.DOTALL)
+DATABASE_PLACEHOLDER = f"<database>\n{TRUNCATION_MARKER}\n</database>"
+
+PROMPT_TEMPLATE = """
+{prompt}
+Please utilize the following lessons and concepts from our business textbook database to assist in your answer:
+<database>
+{vector_info}
+</database>
+"""
+
+def estimate_tokens(text):
+    # Words are split into pieces of at most six characters, which tracks BPE token
+    # counts for English prose closely enough for budgeting without a tokenizer
+    return len(_TOKEN_PIECE_RE.findall(text))
+
+def truncate_to_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    pieces = 0
+    for match in _TOKEN_PIECE_RE.finditer(text):
+        pieces += 1
+        if pieces > max_tokens:
+            return text[:match.start()].rstrip() + f" {TRUNCATION_MARKER}"
+    return text
+
+def split_passages(vector_info):
+    # query_pinecone formats matches as "Score: <score>, Text: <text>" blocks
+    if not _PASSAGE_RE.search(vector_info):
+        return None
+    return [passage.strip() for passage in _PASSAGE_RE.split(vector_info) if passage.strip()]
+
+def compress_passage(text, seen_sentences):
+    kept = []
+    for sentence in _SENTENCE_RE.split(' '.join(text.split())):
+        key = sentence.lower()
+        if key in seen_sentences:
+            continue
+        seen_sentences.add(key)
+        kept.append(sentence)
+    return ' '.join(kept)
+
+def compress_context(vector_info, token_budget, passage_max_tokens=600):
+    passages = split_passages(vector_info)
+    if passages is None:
+        # Status and error strings are passed through unchanged
+        return truncate_to_tokens(vector_info, token_budget)
+    seen_sentences = set()
+    blocks = []
+    used = 0
+    for number, passage in enumerate(passages, start=1):
+        passage = compress_passage(passage, seen_sentences)
+        if not passage:
+            continue
+        remaining = token_budget - used
+        if remaining <= 0:
+            break
+        block = f"[{number}] {truncate_to_tokens(passage, min(passage_max_tokens, remaining))}"
+        blocks.append(block)
+        used += estimate_tokens(block)
+    return '\n\n'.join(blocks)
+
+def content_text(content):
+    parts = content['parts'] if isinstance(content, dict) else content.parts
+    return ''.join(part if isinstance(part, str) else getattr(part, 'text', '') for part in parts)
+
+def content_role(content):
+    return content['role'] if isinstance(content, dict) else content.role
+
+class PromptAssembler:
+    def __init__(self, stage_budgets=None, default_budget=12000, history_budget=None,
+                 passage_max_tokens=600, truncated_turn_tokens=400,
+                 context_windows=None, default_context_window=1048576, context_margin=0.9):
+        # history_budget=None sizes the history to the model's context window, less
+        # a safety margin for the token estimate, the stage's prompt budget and its output limit
+        self.stage_budgets = stage_budgets or {}
+        self.default_budget = default_budget
+        self.history_budget = history_budget
+        self.passage_max_tokens = passage_max_tokens
+        self.truncated_turn_tokens = truncated_turn_tokens
+        self.context_windows = context_windows or {}
+        self.default_context_window = default_context_window
+        self.context_margin = context_margin
+
+    def budget_for(self, stage_name):
+        return self.stage_budgets.get(stage_name, self.default_budget)
+
+    def history_budget_for(self, stage_name, model=None, max_output_tokens=None):
+        if self.history_budget is not None:
+            return self.history_budget
+        window = self.context_windows.get(model, self.default_context_window)
+        return max(0, int(window * self.context_margin) - self.budget_for(stage_name) - (max_output_tokens or 0))
+
+    def assemble(self, stage_name, prompt, vector_info):
+        template_tokens = estimate_tokens(PROMPT_TEMPLATE.format(prompt=prompt, vector_info=""))
+        context_budget = max(0, self.budget_for(stage_name) - template_tokens)
+        context = compress_context(vector_info, context_budget, self.passage_max_tokens)
+        return PROMPT_TEMPLATE.format(prompt=prompt, vector_info=context)
+
+    def trim_history(self, history, budget=None):
+        # A history within the budget is passed through untouched. Otherwise, oldest
+        # first, the retrieved <database> context of user turns is stripped, and then
+        # turns are cut down to their opening lines until the history fits. Turns are
+        # never dropped, so every earlier report keeps at least its opening.
+        budget = self.history_budget_for(None) if budget is None else budget
+        turns = [[content_role(content), content_text(content)] for content in history]
+        # Gemini requires the history to start with a user turn
+        while turns and turns[0][0] != 'user':
+            turns.pop(0)
+        sizes = [estimate_tokens(text) for _, text in turns]
+        total = sum(sizes)
+        if total <= budget and len(turns) == len(history):
+            return list(history), total
+
+        def shrink(position, text):
+            nonlocal total
+            tokens = estimate_tokens(text)
+            total += tokens - sizes[position]
+            turns[position][1], sizes[position] = text, tokens
+
+        for position, (role, text) in enumerate(turns):
+            if total <= budget:
+                break
+            if role == 'user':
+                shrink(position, _DATABASE_RE.sub(DATABASE_PLACEHOLDER, text))
+        for position, (role, text) in enumerate(turns):
+            if total <= budget:
+                break
+            shrink(position, truncate_to_tokens(text, self.truncated_turn_tokens))
+        return [{'role': role, 'parts': [text]} for role, text in turns], total
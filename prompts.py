@@ -180,3 +180,38 @@ REWRITE_PROMPT = """In roughly 5600 words, Please rewrite the entirety of the re
 
 IMPLEMENTATION_PROMPT = """In roughly 5600 words, build a very highly detailed and comprehensive implementation roadmap, ensure there are clear, easy to follow, and detailed actionable steps with a list of ideas on how to strategically accomplish the steps, with three paragraphs of commentary for each step. Also have a "One Day Quick Start" section after the commentary that shows what literal tasks you can do in one day to get the ball rolling."""
 
+
+SUMMARY_PROMPT = """
+Write a detailed, comprehensive summary of the following business consultation conversation, focusing on the highly specific key concepts regarding the business problem, highly specific business information/metrics, and highly specific questions based on the problem. Do not mention the logic technique strategies like Q* or Monte Carlo as they are irrelevant.  Give more weight to the most recent exchanges. Capture the evolving context of the discussion while highlighting the specific complex business issues. At the end, provide a long list of relevant questions, keywords, and phrases optimized for vector search in my corpus of business textbooks.
+
+Conversation transcript:
+{conversation_history}
+
+Summary:
+"""
+
+INCREMENTAL_SUMMARY_PROMPT = """
+Below is the running summary of a business consultation conversation, followed by the newest exchange. Rewrite the summary so it incorporates the newest exchange, focusing on the highly specific key concepts regarding the business problem, highly specific business information/metrics, and highly specific questions based on the problem. Do not mention the logic technique strategies like Q* or Monte Carlo as they are irrelevant.  Give more weight to the newest exchange, but keep every still-relevant fact from the running summary. Capture the evolving context of the discussion while highlighting the specific complex business issues. At the end, provide a long list of relevant questions, keywords, and phrases optimized for vector search in my corpus of business textbooks.
+
+Running summary:
+{running_summary}
+
+Newest exchange:
+{new_exchange}
+
+Updated summary:
+"""
+
+COMPLETENESS_CHECK_PROMPT = """
+The following is the final portion of a long response to the instructions below. Decide whether the response is finished or whether it was cut off and should be continued. Reply with exactly "DONE" if the response is complete, or "NOT DONE" if it stops early, ends mid-sentence, leaves sections of the instructions unaddressed, or falls well short of a requested length.
+
+Instructions:
+{prompt}
+
+Response length so far: {word_count} words
+
+End of response:
+{response_tail}
+
+Answer:
+"""
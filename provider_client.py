@@ -0,0 +1,278 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+from tracing import current_span, registry
+
+# Exceptions are matched by class name and HTTP status so no provider SDK has to be imported here
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RATE_LIMIT_ERRORS = {'RateLimitError', 'ResourceExhausted', 'TooManyRequests'}
+TRANSIENT_ERRORS = RATE_LIMIT_ERRORS | {
+    'APIConnectionError', 'APITimeoutError', 'InternalServerError', 'ServiceUnavailable',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'ServerError', 'ServerDisconnectedError',
+}
+
+class ProviderError(Exception):
+    def __init__(self, provider, message, attempts=0):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.attempts = attempts
+
+class CircuitOpenError(ProviderError):
+    pass
+
+def status_of(error):
+    for attribute in ('status_code', 'status', 'code'):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+def is_rate_limited(error):
+    return type(error).__name__ in RATE_LIMIT_ERRORS or status_of(error) == 429
+
+def is_retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in TRANSIENT_ERRORS or status_of(error) in RETRYABLE_STATUS
+
+def retry_after(error):
+    # Seconds from a Retry-After header, if the error carries the HTTP response
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    # Client-side rate limit shared by every caller of a provider. A 429 pauses the
+    # whole bucket, so concurrent stages back off together instead of each finding out.
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        now = time.monotonic()
+        self._refill(now)
+        if now >= self.paused_until and self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        while not self.try_acquire(tokens):
+            now = time.monotonic()
+            await asyncio.sleep(max(self.paused_until - now, (tokens - self.tokens) / self.rate, 0.001))
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive transient failures and fails calls fast
+    # until reset_timeout has passed; then one probe call at a time decides whether it closes.
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.opens = 0
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open":
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            self.probe_started_at = None
+        # A probe that never reported back (e.g. was cancelled) does not block forever
+        if self.probe_started_at is None or now - self.probe_started_at >= self.reset_timeout:
+            self.probe_started_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+
+class ProviderClient:
+    # Wraps calls to one provider with a per-attempt timeout, an overall deadline,
+    # retries with exponential backoff and full jitter, a token bucket, a circuit
+    # breaker and, for idempotent reads, a hedged duplicate request that is sent
+    # when the first one is slower than the recent p95 (never sooner than hedge_after).
+    def __init__(self, name, timeout=None, deadline=None, max_attempts=4, backoff_base=0.5,
+                 backoff_max=16.0, rate=None, burst=None, hedge_after=None,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._latencies = deque(maxlen=200)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _count(self, metric, **labels):
+        registry.increment(f'ceo_pro_provider_{metric}_total', {'provider': self.name, **labels})
+
+    def hedge_delay(self):
+        if len(self._latencies) < 20:
+            return self.hedge_after
+        ordered = sorted(self._latencies)
+        return max(self.hedge_after, ordered[int(0.95 * (len(ordered) - 1))])
+
+    def backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        server_delay = retry_after(error)
+        return max(delay, server_delay) if server_delay is not None else delay
+
+    async def call(self, func, timeout=None, deadline=None, hedge=False):
+        # func is called once per attempt (twice when hedged) and must return an awaitable
+        timeout = timeout or self.timeout
+        deadline = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline if deadline else None
+        self.calls += 1
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.rejected += 1
+                self._count('rejected')
+                raise CircuitOpenError(self.name, f"circuit open after {self.breaker.failures} consecutive failures", attempt)
+            attempt += 1
+            attempt_timeout = timeout
+            if deadline_at is not None:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    self.failures += 1
+                    self._count('failures')
+                    raise ProviderError(self.name, f"deadline of {deadline:.1f}s exceeded", attempt - 1)
+                attempt_timeout = min(timeout, remaining) if timeout else remaining
+            try:
+                result = await self._attempt(func, attempt_timeout, hedge and self.hedge_after is not None)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and attempt_timeout:
+                    message = f"no response within {attempt_timeout:.1f}s"
+                else:
+                    message = f"{type(e).__name__}: {e}"
+                if not is_retryable(e):
+                    # The provider answered, it just rejected this request
+                    self.breaker.record_success()
+                    self.failures += 1
+                    self._count('failures')
+                    raise ProviderError(self.name, message, attempt) from e
+                rate_limited = is_rate_limited(e)
+                if not rate_limited:
+                    self.breaker.record_failure()
+                delay = self.backoff(attempt, e)
+                if attempt >= self.max_attempts or (deadline_at is not None and time.monotonic() + delay >= deadline_at):
+                    self.failures += 1
+                    self._count('failures')
+                    raise ProviderError(self.name, f"{message} (gave up after {attempt} attempt(s))", attempt) from e
+                if rate_limited and self.bucket is not None:
+                    self.bucket.pause(delay)
+                self.retries += 1
+                self._count('retries', reason="rate_limit" if rate_limited else type(e).__name__)
+                span = current_span.get()
+                if span is not None:
+                    span.add('retries')
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _attempt(self, func, timeout, hedge):
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        started = time.monotonic()
+        if hedge:
+            result = await self._hedged(func, timeout)
+        else:
+            result = await asyncio.wait_for(func(), timeout)
+        self._latencies.append(time.monotonic() - started)
+        return result
+
+    async def _hedged(self, func, timeout):
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + timeout if timeout else None
+        first = asyncio.ensure_future(func())
+        started = [first]
+        pending = {first}
+        try:
+            hedge_delay = self.hedge_delay()
+            if timeout:
+                hedge_delay = min(hedge_delay, timeout)
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done and (self.bucket is None or self.bucket.try_acquire()):
+                self.hedges += 1
+                self._count('hedges')
+                hedged = asyncio.ensure_future(func())
+                started.append(hedged)
+                pending.add(hedged)
+            while True:
+                remaining = None if deadline_at is None else deadline_at - loop.time()
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError()
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                error = None
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+        finally:
+            for task in started:
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()
+                else:
+                    task.cancel()
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'circuit': self.breaker.state,
+            'circuit_opens': self.breaker.opens,
+        }
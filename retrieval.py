@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from prompt_assembly import estimate_tokens, truncate_to_tokens
+
+class RetrievalClient:
+    def __init__(self, index, namespace, run_blocking, top_k=12, score_threshold=0.0,
+                 context_token_budget=None, stats_ttl=300.0, provider=None):
+        self.index = index
+        self.namespace = namespace
+        self.run_blocking = run_blocking
+        self.top_k = top_k
+        self.score_threshold = score_threshold
+        self.context_token_budget = context_token_budget
+        self.stats_ttl = stats_ttl
+        self.provider = provider
+        self._stats = None
+        self._stats_fetched_at = 0.0
+        self._stats_lock = None
+
+    async def _call(self, func, **kwargs):
+        # Index reads are idempotent, so they may be hedged
+        if self.provider is None:
+            return await self.run_blocking(func, **kwargs)
+        return await self.provider.call(lambda: self.run_blocking(func, **kwargs), hedge=True)
+
+    async def describe(self):
+        # Index stats only change when the corpus is re-ingested, so cache them
+        if self._stats_lock is None:
+            self._stats_lock = asyncio.Lock()
+        async with self._stats_lock:
+            if self._stats is None or time.monotonic() - self._stats_fetched_at > self.stats_ttl:
+                self._stats = await self._call(self.index.describe_index_stats)
+                self._stats_fetched_at = time.monotonic()
+            return self._stats
+
+    def invalidate(self):
+        self._stats = None
+
+    async def vector_count(self):
+        stats = await self.describe()
+        namespaces = stats['namespaces'] or {}
+        if self.namespace in namespaces:
+            return namespaces[self.namespace]['vector_count']
+        return stats['total_vector_count']
+
+    async def is_empty(self):
+        return await self.vector_count() == 0
+
+    async def query(self, vector, top_k=None, score_threshold=None):
+        if hasattr(vector, 'tolist'):
+            vector = vector.tolist()
+        results = await self._call(
+            self.index.query,
+            namespace=self.namespace,
+            vector=vector,
+            top_k=top_k or self.top_k,
+            include_values=False,
+            include_metadata=True
+        )
+        threshold = self.score_threshold if score_threshold is None else score_threshold
+        return [
+            {
+                'id': match['id'],
+                'score': match['score'],
+                'text': (match['metadata'] or {}).get('text', 'No text available'),
+            }
+            for match in results['matches']
+            if match['score'] >= threshold
+        ]
+
+    def format_context(self, matches, token_budget=None):
+        budget = token_budget or self.context_token_budget
+        blocks = []
+        used = 0
+        for match in matches:
+            block = f"Score: {match['score']}, Text: {match['text']}\n\n"
+            tokens = estimate_tokens(block)
+            if budget and used + tokens > budget:
+                if not blocks:
+                    # Always keep (a prefix of) the best match
+                    blocks.append(truncate_to_tokens(block, budget))
+                break
+            blocks.append(block)
+            used += tokens
+        return ''.join(blocks)
+
+class RetrievalPrefetcher:
+    # Starts retrieval for an upcoming stage in the background so it overlaps the
+    # current stage's generation. With policy "stale" the speculative result is used
+    # even if the summary moved on meanwhile; with "fresh" it is only used when it was
+    # built from the latest summary, otherwise the query is re-run.
+    POLICIES = ("stale", "fresh", "off")
+
+    def __init__(self, query_func, policy="stale"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown prefetch policy: {policy}")
+        self.query_func = query_func
+        self.policy = policy
+        self.hits = 0
+        self.stale_hits = 0
+        self.refetches = 0
+        self.misses = 0
+        self._pending = {}
+
+    def start(self, key, prompt, summary):
+        if self.policy == "off" or key in self._pending:
+            return
+        self._pending[key] = (asyncio.ensure_future(self.query_func(prompt, summary)), summary)
+
+    async def get(self, key, prompt, summary):
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return await self.query_func(prompt, summary)
+        task, prefetched_summary = entry
+        if prefetched_summary != summary:
+            if self.policy == "fresh":
+                task.cancel()
+                self.refetches += 1
+                return await self.query_func(prompt, summary)
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return await task
+
+    def cancel_all(self):
+        for task, _ in self._pending.values():
+            if task.done() and not task.cancelled():
+                # Mark a failed, never-awaited prefetch as handled
+                task.exception()
+            task.cancel()
+        self._pending.clear()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'refetches': self.refetches,
+            'misses': self.misses,
+        }
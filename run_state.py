@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+from pipeline import StageResult
+from prompt_assembly import content_role, content_text
+
+class RunState:
+    # Checkpoint of one consultation: saved after every completed stage so a failed
+    # or disconnected run resumes from the last finished stage instead of PROMPT_1.
+    def __init__(self, path, run_id, user_input, stages=None, summarizer=None, status="running", created_at=None):
+        self.path = path
+        self.run_id = run_id
+        self.user_input = user_input
+        self.stages = stages or {}
+        self.summarizer = summarizer or {}
+        self.status = status
+        self.created_at = created_at or time.time()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(path, data['run_id'], data['user_input'], data['stages'], data.get('summarizer'),
+                   data.get('status', "running"), data.get('created_at'))
+
+    def results(self):
+        results = {}
+        for name, record in self.stages.items():
+            results[name] = StageResult(name, record['response'], record['turns'], record['vector_info'], record['summary'])
+        return results
+
+    def save_stage(self, result, summarizer_state):
+        self.stages[result.name] = {
+            'response': result.response,
+            'turns': [{'role': content_role(turn), 'parts': [content_text(turn)]} for turn in result.turns],
+            'vector_info': result.vector_info,
+            'summary': result.summary,
+            'timings': result.timings,
+            'saved_at': time.time(),
+        }
+        self.summarizer = summarizer_state
+        self.save()
+
+    def mark(self, status):
+        self.status = status
+        self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'run_id': self.run_id,
+                'user_input': self.user_input,
+                'status': self.status,
+                'created_at': self.created_at,
+                'summarizer': self.summarizer,
+                'stages': self.stages,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+class RunStateStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Runs executing in this process; a run is only ever driven by one session
+        self._active = set()
+
+    def path_for(self, run_id):
+        if not run_id or os.path.basename(run_id) != run_id or run_id.startswith('.'):
+            raise ValueError(f"Invalid run id: {run_id!r}")
+        return os.path.join(self.directory, run_id, "state.json")
+
+    def create(self, user_input, run_id=None):
+        run_id = run_id or uuid.uuid4().hex[:16]
+        path = self.path_for(run_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        state = RunState(path, run_id, user_input)
+        state.save()
+        return state
+
+    def exists(self, run_id):
+        try:
+            return os.path.exists(self.path_for(run_id))
+        except ValueError:
+            return False
+
+    def claim(self, run_id):
+        if run_id in self._active:
+            return False
+        self._active.add(run_id)
+        return True
+
+    def release(self, run_id):
+        self._active.discard(run_id)
+
+    def is_active(self, run_id):
+        return run_id in self._active
+
+    def load(self, run_id):
+        path = self.path_for(run_id)
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown run id: {run_id}")
+        return RunState.load(path)
+
+    def prune(self, max_age_seconds):
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for run_id in os.listdir(self.directory):
+            if run_id in self._active:
+                continue
+            path = os.path.join(self.directory, run_id, "state.json")
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(os.path.dirname(path))
+                    removed += 1
+            except OSError:
+                continue
+        return removed
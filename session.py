@@ -0,0 +1,181 @@
+import asyncio
+import contextvars
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from stream_fanout import StreamFanout
+
+# The session that owns the currently running consultation task
+current_session = contextvars.ContextVar('current_session', default=None)
+# The pipeline stage the current task is running, if any
+current_stage = contextvars.ContextVar('current_stage', default=None)
+
+class SchedulerFull(Exception):
+    pass
+
+class ConsultationSession:
+    def __init__(self, base_folder, websocket=None, session_id=None, stream=None):
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.websocket = websocket
+        self.stream = stream
+        if websocket is not None:
+            if self.stream is None:
+                self.stream = StreamFanout()
+            self.stream.subscribe(websocket)
+        self.started_at = datetime.now()
+        self.terminal_output = []
+        self.timestamp = self.started_at.strftime('%Y%m%d_%H%M%S')
+        self.artifact_dir = os.path.join(base_folder, f"CEO-Pro_{self.timestamp}_{self.session_id}")
+        self.job = None
+        # Created when the client starts an interview
+        self.interviewer = None
+        self._artifact_dir_created = False
+        self._stream_owner = None
+        self._held_output = OrderedDict()
+        self._finished_stages = set()
+
+    @property
+    def log_file(self):
+        return self.artifact_path(f"Business_Chatbot_Log_{self.timestamp}.txt")
+
+    @property
+    def event_log_file(self):
+        return self.artifact_path(f"Business_Chatbot_Log_{self.timestamp}.jsonl")
+
+    @property
+    def transcript_file(self):
+        return self.artifact_path(f"Conversation_Transcript_{self.timestamp}.log")
+
+    @property
+    def cleaned_transcript_file(self):
+        return self.artifact_path("Cleaned_Conversation_Transcript.md")
+
+    def artifact_path(self, filename):
+        if not self._artifact_dir_created:
+            os.makedirs(self.artifact_dir, exist_ok=True)
+            self._artifact_dir_created = True
+        return os.path.join(self.artifact_dir, filename)
+
+    @property
+    def busy(self):
+        return self.job is not None and not self.job.done()
+
+    def stream_text(self, text, stage=None):
+        # Concurrent stages stream one at a time: the first stage to produce output
+        # streams live, the others are held back and released in order when it ends.
+        if self.stream is None:
+            return
+        if stage is not None:
+            if self._stream_owner is None:
+                self._stream_owner = stage
+            if stage != self._stream_owner:
+                self._held_output.setdefault(stage, []).append(text)
+                return
+        self.stream.write(text)
+
+    def end_stage_output(self, stage):
+        if stage != self._stream_owner:
+            if stage in self._held_output:
+                self._finished_stages.add(stage)
+            return
+        self._stream_owner = None
+        while self._held_output:
+            next_stage, texts = self._held_output.popitem(last=False)
+            if self.stream is not None:
+                self.stream.write(''.join(texts))
+            if next_stage in self._finished_stages:
+                self._finished_stages.discard(next_stage)
+                continue
+            self._stream_owner = next_stage
+            break
+
+    async def send(self, payload):
+        if self.stream is not None:
+            self.stream.publish(payload)
+
+    async def close(self):
+        if self.stream is not None:
+            await self.stream.close()
+
+class ConsultationScheduler:
+    def __init__(self, max_concurrent=4, max_queued=16):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.running = {}
+        self._queue = None
+        self._workers = []
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def pressure(self):
+        # 0.0 when idle, 1.0 when every slot is busy and the queue is full
+        capacity = self.max_concurrent + self.max_queued
+        return (len(self.running) + self.queue_depth) / capacity if capacity else 0.0
+
+    def submit(self, session, coro_factory):
+        # Reject instead of queueing without bound so callers can push back on clients
+        job = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((session, coro_factory, job))
+        except asyncio.QueueFull:
+            raise SchedulerFull(f"{self.queue_depth} consultations already queued")
+        session.job = job
+        return job
+
+    def cancel(self, session):
+        job = session.job
+        if job is None or job.done():
+            return False
+        task = self.running.get(session.session_id)
+        if task is not None:
+            task.cancel()
+        else:
+            job.cancel()
+        return True
+
+    async def _run(self, session, coro_factory):
+        current_session.set(session)
+        return await coro_factory()
+
+    async def _worker(self):
+        while True:
+            session, coro_factory, job = await self._queue.get()
+            try:
+                if job.cancelled():
+                    continue
+                task = asyncio.create_task(self._run(session, coro_factory))
+                self.running[session.session_id] = task
+                try:
+                    result = await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    if not task.done():
+                        # The worker itself is shutting down
+                        task.cancel()
+                        job.cancel()
+                        raise
+                    job.cancel()
+                except Exception as e:
+                    if not job.done():
+                        job.set_exception(e)
+                else:
+                    if not job.done():
+                        job.set_result(result)
+                finally:
+                    self.running.pop(session.session_id, None)
+            finally:
+                self._queue.task_done()
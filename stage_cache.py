@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def stage_cache_key(model, template, user_input, context):
+    # context covers everything else the generation saw: the assembled prompt with
+    # its retrieval context and the chat history the stage was seeded with
+    parts = (model, _digest(template), _digest(normalize_text(user_input)), _digest(context))
+    return _digest('\0'.join(parts))
+
+class StageCache:
+    # Stage outputs keyed on their full inputs, so repeated consultations replay
+    # instead of regenerating. Entries expire after ttl seconds and the least
+    # recently used are evicted past max_bytes.
+    def __init__(self, db_path, ttl=7 * 86400, max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS stage_outputs (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                model TEXT NOT NULL,
+                template TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                embedding BLOB,
+                elapsed REAL NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_outputs_lookup ON stage_outputs (stage, model, template)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_outputs_last_access ON stage_outputs (last_access)")
+        self._conn.commit()
+
+    def _hit(self, key, payload, elapsed):
+        self._conn.execute("UPDATE stage_outputs SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        self.seconds_saved += elapsed
+        return json.loads(payload)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, elapsed, created FROM stage_outputs WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[2] < time.time() - self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._hit(key, row[0], row[1])
+
+    def find_similar(self, stage, model, template, embedding, threshold):
+        # Nearest cached output for the same stage and template by cosine similarity
+        # of the consultation query embeddings; only used after an exact miss.
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, payload, elapsed, embedding FROM stage_outputs "
+                "WHERE stage = ? AND model = ? AND template = ? AND embedding IS NOT NULL AND created >= ?",
+                (stage, model, _digest(template), time.time() - self.ttl)
+            ).fetchall()
+            best, best_score = None, threshold
+            for row in rows:
+                candidate = np.frombuffer(row[3], dtype=np.float32)
+                if candidate.shape != query.shape:
+                    continue
+                score = float(candidate @ query)
+                if score >= best_score:
+                    best, best_score = row, score
+            if best is None:
+                return None
+            self.semantic_hits += 1
+            # The exact lookup before this already counted a miss
+            self.misses -= 1
+            return self._hit(best[0], best[1], best[2])
+
+    def put(self, key, stage, model, template, payload, embedding=None, elapsed=0.0):
+        blob = None
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            blob = (embedding / (np.linalg.norm(embedding) or 1.0)).tobytes()
+        data = json.dumps(payload)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stage_outputs "
+                "(key, stage, model, template, payload, embedding, elapsed, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, stage, model, _digest(template), data, blob, elapsed, len(data) + len(blob or b''), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute("DELETE FROM stage_outputs WHERE created < ?", (time.time() - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM stage_outputs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM stage_outputs ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM stage_outputs WHERE key = ?", evicted)
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM stage_outputs"
+            ).fetchone()
+            return {
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'seconds_saved': round(self.seconds_saved, 2),
+                'entries': entries,
+                'bytes': size,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
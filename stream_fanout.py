@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+
+class _Subscriber:
+    def __init__(self, websocket, max_pending):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.task = None
+
+class StreamFanout:
+    # Coalesces streamed text into batches flushed every flush_interval seconds or
+    # once max_batch_bytes accumulate. Each subscriber has its own bounded queue and
+    # sender task, so a slow client is dropped instead of stalling the producer.
+    def __init__(self, flush_interval=0.016, max_batch_bytes=4096, max_pending=256, send_timeout=5.0):
+        self.flush_interval = flush_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.batches_sent = 0
+        self.dropped_subscribers = 0
+        self._subscribers = {}
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._timer = None
+
+    def subscribe(self, websocket):
+        subscriber = _Subscriber(websocket, self.max_pending)
+        subscriber.task = asyncio.create_task(self._sender(subscriber))
+        self._subscribers[id(websocket)] = subscriber
+
+    def unsubscribe(self, websocket):
+        subscriber = self._subscribers.pop(id(websocket), None)
+        if subscriber is not None:
+            subscriber.task.cancel()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def write(self, text):
+        if not text:
+            return
+        self._buffer.append(text)
+        self._buffer_bytes += len(text.encode('utf-8'))
+        if self._buffer_bytes >= self.max_batch_bytes:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def publish(self, payload):
+        # Control messages must not overtake text that was written before them
+        self.flush()
+        self._enqueue(json.dumps(payload))
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        content = ''.join(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self.batches_sent += 1
+        self._enqueue(json.dumps({'type': 'stream', 'content': content}))
+
+    def _enqueue(self, message):
+        for subscriber in list(self._subscribers.values()):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(subscriber, "send queue full")
+
+    def _drop(self, subscriber, reason):
+        if self._subscribers.pop(id(subscriber.websocket), None) is None:
+            return
+        self.dropped_subscribers += 1
+        logging.warning(f"Dropping slow stream subscriber: {reason}")
+        subscriber.task.cancel()
+        # Release anyone waiting in drain() on messages that will never be sent
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+            subscriber.queue.task_done()
+        asyncio.ensure_future(self._close_quietly(subscriber.websocket))
+
+    async def _close_quietly(self, websocket):
+        try:
+            await websocket.close(code=1013, reason="Slow consumer")
+        except Exception:
+            pass
+
+    async def _sender(self, subscriber):
+        while True:
+            message = await subscriber.queue.get()
+            try:
+                await asyncio.wait_for(subscriber.websocket.send(message), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._drop(subscriber, f"send took longer than {self.send_timeout}s")
+                return
+            except Exception as e:
+                self._drop(subscriber, str(e))
+                return
+            finally:
+                subscriber.queue.task_done()
+
+    async def drain(self, timeout=None):
+        self.flush()
+        pending = [subscriber.queue.join() for subscriber in self._subscribers.values()]
+        if pending:
+            try:
+                await asyncio.wait_for(asyncio.gather(*pending), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self, timeout=1.0):
+        await self.drain(timeout)
+        for subscriber in list(self._subscribers.values()):
+            subscriber.task.cancel()
+        self._subscribers.clear()
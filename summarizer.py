@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+import google.generativeai as genai
+
+from prompts import INCREMENTAL_SUMMARY_PROMPT, SUMMARY_PROMPT
+
+# Summaries are memoized by content hash and shared by every session in the process
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+MEMO_SIZE = 512
+
+def _memo_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _memo_get(key):
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+    return None
+
+def _memo_put(key, value):
+    with _memo_lock:
+        _memo[key] = value
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+class SummaryResult:
+    def __init__(self, text, input_tokens=0, output_tokens=0, cached=False):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cached = cached
+
+async def generate_summary(prompt, model_name, provider=None, max_output_tokens=None):
+    key = _memo_key(model_name, str(max_output_tokens), prompt)
+    cached = _memo_get(key)
+    if cached is not None:
+        return SummaryResult(cached, cached=True)
+
+    model = genai.GenerativeModel(model_name, generation_config={'max_output_tokens': max_output_tokens} if max_output_tokens else None)
+    if provider is not None:
+        response = await provider.call(lambda: model.generate_content_async(prompt))
+    else:
+        response = await model.generate_content_async(prompt)
+    if not response.parts:
+        raise ValueError("Empty response from Gemini API")
+
+    usage = getattr(response, 'usage_metadata', None)
+    result = SummaryResult(
+        response.text,
+        getattr(usage, 'prompt_token_count', 0) or 0,
+        getattr(usage, 'candidates_token_count', 0) or 0
+    )
+    _memo_put(key, result.text)
+    return result
+
+class IncrementalSummarizer:
+    # Folds only the exchanges recorded since the last refresh into a running summary,
+    # so each call costs O(summary + new exchange) instead of O(whole conversation).
+    def __init__(self, model_name='gemini-1.5-flash', provider=None, max_output_tokens=None):
+        self.model_name = model_name
+        self.provider = provider
+        self.max_output_tokens = max_output_tokens
+        self.summary = ""
+        self.calls = 0
+        self.memo_hits = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.last_result = None
+        self._pending = []
+        self._lock = None
+
+    def record(self, role, message):
+        self._pending.append(f"{role}: {message}")
+
+    async def refresh(self):
+        # Stages running concurrently refresh one at a time; exchanges recorded while a
+        # refresh is in flight are left for the next one.
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return self.summary
+            pending, self._pending = self._pending, []
+            new_exchange = "\n\n".join(pending)
+            if self.summary:
+                prompt = INCREMENTAL_SUMMARY_PROMPT.format(running_summary=self.summary, new_exchange=new_exchange)
+            else:
+                prompt = SUMMARY_PROMPT.format(conversation_history=new_exchange)
+
+            try:
+                result = await generate_summary(prompt, self.model_name, self.provider, self.max_output_tokens)
+            except BaseException:
+                self._pending = pending + self._pending
+                raise
+            self.summary = result.text
+            self.last_result = result
+            self.calls += 1
+            if result.cached:
+                self.memo_hits += 1
+            self.input_tokens += result.input_tokens
+            self.output_tokens += result.output_tokens
+            return self.summary
+
+    @property
+    def has_pending(self):
+        return bool(self._pending)
+
+    async def adopt(self, summary):
+        # Takes a summary produced elsewhere (e.g. a cached stage output) as covering
+        # everything recorded so far
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self.summary = summary
+            self._pending = []
+            return self.summary
+
+    def snapshot(self):
+        return {'summary': self.summary, 'pending': list(self._pending)}
+
+    def restore(self, state):
+        self.summary = state.get('summary', "")
+        self._pending = list(state.get('pending', []))
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'memo_hits': self.memo_hits,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+        }
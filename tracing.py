@@ -0,0 +1,210 @@
+import bisect
+import contextvars
+import itertools
+import json
+import threading
+import time
+
+# The trace of the consultation run the current task belongs to, and the open span
+current_trace = contextvars.ContextVar('current_trace', default=None)
+current_span = contextvars.ContextVar('current_span', default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Span attributes that are summed into counters
+COUNTED_ATTRIBUTES = ('chunks', 'bytes', 'input_tokens', 'output_tokens', 'retries')
+
+_span_ids = itertools.count(1)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_span(self, span):
+        labels = {'span': span.name}
+        if span.attributes.get('stage') is not None:
+            labels['stage'] = span.attributes['stage']
+        self.observe('ceo_pro_span_seconds', labels, span.duration)
+        if span.attributes.get('ttft') is not None:
+            self.observe('ceo_pro_time_to_first_token_seconds', labels, span.attributes['ttft'])
+        for attribute in COUNTED_ATTRIBUTES:
+            if span.attributes.get(attribute):
+                self.increment(f'ceo_pro_{attribute}_total', {'span': span.name}, span.attributes[attribute])
+        if span.error is not None:
+            self.increment('ceo_pro_span_errors_total', {'span': span.name})
+
+    def render_prometheus(self):
+        lines = []
+        typed = set()
+        with self._lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+                prefix = f"{label_text}," if label_text else ""
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                    lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_text}}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+                lines.append(f'{name}{{{label_text}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        with self._lock:
+            return {
+                f"{name}{dict(labels)}": {
+                    'count': histogram.count,
+                    'mean': round(histogram.total / histogram.count, 4) if histogram.count else 0.0,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                }
+                for (name, labels), histogram in sorted(self.histograms.items())
+            }
+
+class Span:
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = None
+        self.attributes = attributes
+        self.start = None
+        self.end = None
+        self.error = None
+        self._first_token_at = None
+        self._token = None
+
+    @property
+    def duration(self):
+        if self.start is None:
+            return 0.0
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, attribute, value=1):
+        self.attributes[attribute] = self.attributes.get(attribute, 0) + value
+
+    def first_token(self):
+        if self._first_token_at is None:
+            self._first_token_at = time.perf_counter()
+            self.attributes['ttft'] = self._first_token_at - self.start
+
+    def chunk(self, text):
+        self.first_token()
+        self.add('chunks')
+        self.add('bytes', len(text.encode('utf-8')))
+
+    def to_dict(self, origin):
+        return {
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start': round(self.start - origin, 6),
+            'duration': round(self.duration, 6),
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+    def __enter__(self):
+        parent = current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.perf_counter()
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__ if exc is None else f"{exc_type.__name__}: {exc}"
+        registry.record_span(self)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append(self)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class Trace:
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'duration': round(time.perf_counter() - self.started, 6),
+            'spans': [span.to_dict(self.started) for span in sorted(self.spans, key=lambda span: span.start)],
+        }
+
+    def totals(self):
+        totals = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.name, {'count': 0, 'seconds': 0.0})
+            entry['count'] += 1
+            entry['seconds'] = round(entry['seconds'] + span.duration, 3)
+        return totals
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, default=str)
+
+def span(name, **attributes):
+    return Span(name, **attributes)
+
+registry = MetricsRegistry()